@@ -0,0 +1,122 @@
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class AdmissionError(Exception):
+    """A request refused for now (429); the client may retry after ``retry_after`` seconds"""
+
+    def __init__(self, detail: str, retry_after: int):
+        super().__init__(detail)
+        self.status_code = 429
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class RateLimiter:
+    """
+    One token bucket per client: ``burst`` requests at once, refilled at
+    ``rate`` requests per second.
+
+    Buckets of the ``max_clients`` most recently seen clients are kept; a
+    client that was idle long enough to be dropped has a full bucket anyway.
+    Buckets are per process, so with several workers a client gets up to
+    that many times the rate.
+    """
+
+    def __init__(self, rate: float, burst: int, max_clients: int = 100000):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.max_clients = max_clients
+        # client -> (tokens, monotonic time of that count)
+        self._buckets: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.limited = 0
+
+    def take(self, client: str, cost: int = 1) -> float:
+        """Take ``cost`` tokens; 0 if they were there, else seconds until they will be"""
+        # A request costing more than the burst can never fit; it empties the bucket instead
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [float(self.burst), now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= cost:
+                bucket[0] -= cost
+                return 0.0
+            self.limited += 1
+            return (cost - bucket[0]) / self.rate
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "limited": self.limited,
+        }
+
+
+class AdmissionControl:
+    """
+    Per-client rate limits by route, and load shedding for the whole server.
+
+    A request is counted against its client (the user, when known) and,
+    through ``address_limits``, against the address it came from, so a
+    client cannot escape its limit by sending a new user id each time.
+    Routes without a limiter (rate 0 in the settings) are only shed.
+    """
+
+    def __init__(self, limits: Dict[str, RateLimiter], address_limits: Optional[Dict[str, RateLimiter]] = None):
+        self.limits = limits
+        self.address_limits = address_limits or {}
+        self.shed_count = 0
+
+    def admit(self, route: str, client: str, cost: int = 1, address: Optional[str] = None):
+        # The address first, so a refused request does not cost the client its tokens
+        for limiter, key in ((self.address_limits.get(route), address), (self.limits.get(route), client)):
+            if limiter is None or key is None:
+                continue
+            wait = limiter.take(key, cost)
+            if wait > 0:
+                raise AdmissionError("Too many requests, slow down", max(1, math.ceil(wait)))
+
+    def shed(self, detail: str, retry_after: int):
+        self.shed_count += 1
+        raise AdmissionError(detail, retry_after)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limits": {route: limiter.stats() for route, limiter in self.limits.items()},
+            "address_limits": {route: limiter.stats() for route, limiter in self.address_limits.items()},
+            "shed": self.shed_count,
+        }
+
+
+def create_admission(
+    limits: Dict[str, Tuple[float, int]], max_clients: int, address_factor: float = 0.0
+) -> AdmissionControl:
+    """
+    ``limits`` maps a route to (requests per minute, burst); a rate of 0 means
+    no limit. Addresses get ``address_factor`` times those (0: no address limits).
+    """
+    return AdmissionControl(
+        {
+            route: RateLimiter(per_minute / 60, burst, max_clients)
+            for route, (per_minute, burst) in limits.items()
+            if per_minute > 0
+        },
+        {
+            route: RateLimiter(per_minute * address_factor / 60, int(burst * address_factor), max_clients)
+            for route, (per_minute, burst) in limits.items()
+            if per_minute > 0 and address_factor > 0
+        },
+    )
@@ -0,0 +1,175 @@
+import gzip
+import json
+import os
+import struct
+import zlib
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+ARCHIVE_PREFIX = "archive-"
+ARCHIVE_SUFFIX = ".ndjson.gz"
+
+# Uncompressed bytes per gzip member; a read decompresses one member
+BLOCK_SIZE = 256 * 1024
+# The footer has to fit in a gzip extra field; larger days get larger blocks
+MAX_BLOCKS = 4000
+
+# Subfield id of the footer index in the gzip extra field
+FOOTER_FIELD = b"LX"
+# Empty deflate stream, then CRC32 and size of no data
+EMPTY_TAIL = b"\x03\x00" + b"\x00" * 8
+
+
+class Block(NamedTuple):
+    segment: int
+    offset: int  # where the block starts in its segment
+    start: int  # where its gzip member starts in the archive
+    length: int  # compressed
+    size: int  # uncompressed
+
+
+def archive_name(day: str) -> str:
+    return f"{ARCHIVE_PREFIX}{day}{ARCHIVE_SUFFIX}"
+
+
+def _footer(blocks: List[Block]) -> bytes:
+    """An empty gzip member carrying the block index in its extra field"""
+    payload = zlib.compress(json.dumps([list(block) for block in blocks], separators=(",", ":")).encode("utf-8"))
+    field_length = len(payload) + 4
+    extra_length = 4 + field_length
+    member_length = 10 + 2 + extra_length + len(EMPTY_TAIL)
+    if extra_length > 0xFFFF:
+        raise ValueError("archive index is too large")
+    header = b"\x1f\x8b\x08\x04" + b"\x00" * 4 + b"\x00\xff"
+    return (
+        header
+        + struct.pack("<H", extra_length)
+        + FOOTER_FIELD
+        + struct.pack("<H", field_length)
+        + payload
+        + struct.pack("<I", member_length)
+        + EMPTY_TAIL
+    )
+
+
+class Archive:
+    """
+    Closed log segments of one day in a single gzip file.
+
+    Each segment is stored as gzip members of about ``BLOCK_SIZE`` bytes,
+    cut at line ends, and the file ends with a small footer member whose
+    extra field indexes the blocks by (segment, offset). Records keep their
+    locations, so indexes and cursors stay valid after archiving, and any
+    record can be read by decompressing only its block. The file is an
+    ordinary gzip stream of the records (e.g. for ``zcat``).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.blocks, self.data_length = self._read_footer()
+        self.by_segment: Dict[int, List[Block]] = {}
+        for block in self.blocks:
+            self.by_segment.setdefault(block.segment, []).append(block)
+
+    def _read_footer(self) -> Tuple[List[Block], int]:
+        with open(self.path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            size = f.tell()
+            f.seek(size - 14)
+            trailer = f.read(14)
+            if trailer[4:] != EMPTY_TAIL:
+                raise ValueError(f"{self.path} has no archive footer")
+            member_length = struct.unpack("<I", trailer[:4])[0]
+            f.seek(size - member_length)
+            member = f.read(member_length)
+        if member[:4] != b"\x1f\x8b\x08\x04" or member[12:14] != FOOTER_FIELD:
+            raise ValueError(f"{self.path} has a damaged archive footer")
+        field_length = struct.unpack("<H", member[14:16])[0]
+        payload = member[16:16 + field_length - 4]
+        blocks = [Block(*entry) for entry in json.loads(zlib.decompress(payload))]
+        return blocks, size - member_length
+
+    @property
+    def segments(self) -> List[int]:
+        return sorted(self.by_segment)
+
+    def segment_size(self, segment: int) -> int:
+        return sum(block.size for block in self.by_segment.get(segment, []))
+
+    def read_block(self, block: Block, f=None) -> bytes:
+        if f is None:
+            with open(self.path, "rb") as f:
+                return self.read_block(block, f)
+        f.seek(block.start)
+        return gzip.decompress(f.read(block.length))
+
+    def find(self, segment: int, offset: int) -> Optional[Block]:
+        """The block holding the line that starts at ``offset`` of ``segment``"""
+        found = None
+        for block in self.by_segment.get(segment, []):
+            if block.offset > offset:
+                break
+            found = block
+        if found is None or offset >= found.offset + found.size:
+            return None
+        return found
+
+    def iter_lines(self, segment: int, start: int = 0) -> Iterator[Tuple[int, bytes]]:
+        """Yield (offset, line) for the lines of ``segment`` from offset ``start`` on"""
+        with open(self.path, "rb") as f:
+            for block in self.by_segment.get(segment, []):
+                if block.offset + block.size <= start:
+                    continue
+                data = self.read_block(block, f)
+                position = max(start - block.offset, 0)
+                while position < len(data):
+                    end = data.find(b"\n", position)
+                    end = len(data) if end < 0 else end + 1
+                    yield block.offset + position, data[position:end]
+                    position = end
+
+
+def write_archive(path: str, segments: List[Tuple[int, str]], block_size: int = BLOCK_SIZE):
+    """
+    Write ``segments`` ((number, path) pairs) into the archive at ``path``,
+    keeping the blocks already in it. The new file replaces the old one only
+    once it is complete and on disk.
+    """
+    existing: List[Block] = []
+    data_length = 0
+    if os.path.exists(path):
+        archive = Archive(path)
+        existing, data_length = archive.blocks, archive.data_length
+        # Left behind if a run stopped between writing the archive and removing them
+        segments = [(number, segment_path) for number, segment_path in segments if number not in archive.by_segment]
+    if not segments:
+        return
+    total = sum(os.path.getsize(segment_path) for _, segment_path in segments)
+    block_size = max(block_size, total // max(MAX_BLOCKS - len(existing), 1) + 1)
+
+    temp = path + ".tmp"
+    blocks = list(existing)
+    with open(temp, "wb") as out:
+        if data_length:
+            with open(path, "rb") as f:
+                remaining = data_length
+                while remaining:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    out.write(chunk)
+                    remaining -= len(chunk)
+        for number, segment_path in segments:
+            with open(segment_path, "rb") as f:
+                offset = 0
+                while True:
+                    data = f.read(block_size)
+                    if not data:
+                        break
+                    # Finish the last line, so every block starts at a record
+                    data += f.readline()
+                    member = gzip.compress(data, compresslevel=6, mtime=0)
+                    blocks.append(Block(number, offset, out.tell(), len(member), len(data)))
+                    out.write(member)
+                    offset += len(data)
+        out.write(_footer(blocks))
+        out.flush()
+        os.fsync(out.fileno())
+    os.replace(temp, path)
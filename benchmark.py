@@ -0,0 +1,306 @@
+"""
+In-process benchmarks of the request paths that matter: submitting the
+form, reading /logs and improving text. Requests go straight to the ASGI
+app, without a network or a server, so the numbers show the app's own cost.
+
+    python benchmark.py                                  # full run, prints JSON
+    python benchmark.py --quick --output results.json    # smaller run, saved
+    python benchmark.py --baseline results.json          # exit 1 on regressions
+
+Settings come from the environment like the app's own (e.g. STORAGE_BACKEND,
+WRITE_DURABILITY); directories are temporary and rate limits are off.
+
+Results are ``{"meta": {...}, "metrics": {name: {"value", "unit", "better"}}}``.
+With ``--baseline``, every metric that got worse than the baseline by more
+than ``--threshold`` (a fraction, default 0.2) is reported as a regression.
+"""
+import argparse
+import asyncio
+import dataclasses
+import json
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from form import create_app
+from schemas import FormSubmission
+from settings import Settings
+
+# Existing submissions in the log when submit throughput and /logs are measured
+DEFAULT_SIZES = (0, 10_000, 100_000)
+QUICK_SIZES = (0, 1_000, 10_000)
+# Characters per text for the improvement latency
+IMPROVE_SIZES = (100, 1_000, 10_000)
+
+SEED_BATCH = 1000
+# Timed runs of each GET; the median is reported
+GET_REPEATS = 3
+
+
+async def asgi_request(
+    app, method: str, path: str, body: bytes = b"", headers: Iterable[Tuple[str, str]] = ()
+) -> Tuple[int, int]:
+    """Send one request to ``app``; returns the status and the number of body bytes"""
+    path, _, query = path.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": [(b"host", b"benchmark")] + [(k.lower().encode(), v.encode()) for k, v in headers],
+        "client": ("127.0.0.1", 0),
+        "server": ("benchmark", 80),
+    }
+    received = False
+    disconnected = asyncio.Event()
+    status, size = 0, 0
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {"type": "http.request", "body": body, "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status, size
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            # Only counted, so a large response does not pile up here
+            size += len(message.get("body", b""))
+
+    try:
+        await app(scope, receive, send)
+    finally:
+        disconnected.set()
+    return status, size
+
+
+async def post_json(app, path: str, data: Any, headers: Iterable[Tuple[str, str]] = ()) -> Tuple[int, int]:
+    body = json.dumps(data).encode("utf-8")
+    return await asgi_request(app, "POST", path, body, [("content-type", "application/json"), *headers])
+
+
+def sample_submission(number: int) -> Dict[str, Any]:
+    return {
+        "user": {"id": number % 1000, "first_name": "Bench", "username": f"user{number % 1000}"},
+        "events": [{
+            "title": f"Event {number}",
+            "link": "https://example.com/events/" + str(number),
+            "description": "Описание мероприятия для детей и родителей. " * 6,
+            "source": "benchmark",
+            "children_terms": "Возраст 6-12 лет",
+            "message": "",
+        }],
+    }
+
+
+def seed(storage, count: int):
+    """Write ``count`` submissions straight through the storage backend"""
+    for start in range(0, count, SEED_BATCH):
+        batch = []
+        for number in range(start, min(start + SEED_BATCH, count)):
+            submission = FormSubmission.model_validate(sample_submission(number))
+            submission.record_id = storage.ids.next()
+            batch.append(submission)
+        storage.write_batch(batch)
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def bench_settings(directory: str) -> Settings:
+    return dataclasses.replace(
+        Settings.from_env(),
+        log_dir=f"{directory}/logs",
+        sqlite_path=f"{directory}/logs/submissions.db",
+        upload_dir=f"{directory}/uploads",
+        static_dir=f"{directory}/static",
+        submit_rate=0,
+        improve_rate=0,
+        upload_rate=0,
+        shed_write_backlog=10**9,
+        shed_improve_in_flight=10**9,
+    )
+
+
+async def bench_submit(app, requests: int, concurrency: int) -> Dict[str, float]:
+    latencies: List[float] = []
+    failures = 0
+    numbers = iter(range(requests))
+
+    async def client():
+        nonlocal failures
+        for number in numbers:
+            started = time.perf_counter()
+            status, _ = await post_json(app, "/api/submit-form", sample_submission(number))
+            latencies.append(time.perf_counter() - started)
+            failures += status != 200
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "throughput": requests / elapsed,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "failures": failures,
+    }
+
+
+async def bench_get(app, path: str) -> Dict[str, float]:
+    """Median time of a GET, then its peak traced memory in one more run"""
+    times = []
+    for _ in range(GET_REPEATS):
+        started = time.perf_counter()
+        status, size = await asgi_request(app, "GET", path)
+        times.append(time.perf_counter() - started)
+        if status != 200:
+            raise RuntimeError(f"GET {path} answered {status}")
+
+    tracemalloc.start()
+    try:
+        await asgi_request(app, "GET", path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"seconds": percentile(times, 0.5), "peak_bytes": peak, "bytes": size}
+
+
+async def bench_improve(app, size: int, requests: int) -> Dict[str, float]:
+    latencies = []
+    words = "Это важное мероприятие для детей . " * (size // 30 + 1)
+    for number in range(requests):
+        # A different text each time, so the improvement cache does not answer
+        text = f"{number} {words}"[:size]
+        started = time.perf_counter()
+        status, _ = await post_json(app, "/api/improve-text", {"text": text})
+        latencies.append(time.perf_counter() - started)
+        if status != 200:
+            raise RuntimeError(f"/api/improve-text answered {status}")
+    return {"p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95)}
+
+
+async def run_size(existing: int, submits: int, concurrency: int, improve_requests: int) -> Dict[str, Dict[str, Any]]:
+    metrics: Dict[str, Dict[str, Any]] = {}
+
+    def record(name: str, value: float, unit: str, better: str):
+        metrics[name] = {"value": round(value, 6), "unit": unit, "better": better}
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app(bench_settings(directory))
+        async with app.router.lifespan_context(app):
+            services = app.state.services
+            started = time.perf_counter()
+            await asyncio.to_thread(seed, services.storage, existing)
+            print(f"Seeded {existing} submissions in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+            prefix = f"submit.{existing}"
+            result = await bench_submit(app, submits, concurrency)
+            record(f"{prefix}.throughput", result["throughput"], "requests/s", "higher")
+            record(f"{prefix}.p50", result["p50"], "s", "lower")
+            record(f"{prefix}.p95", result["p95"], "s", "lower")
+            if result["failures"]:
+                raise RuntimeError(f"{result['failures']} submissions failed")
+
+            for name, path in (
+                ("logs_page", "/logs"),
+                ("logs_deep_page", f"/logs?offset={existing // 2}"),
+                ("logs_export", "/logs?format=ndjson"),
+            ):
+                result = await bench_get(app, path)
+                record(f"{name}.{existing}.seconds", result["seconds"], "s", "lower")
+                record(f"{name}.{existing}.peak_bytes", result["peak_bytes"], "bytes", "lower")
+
+            if existing == 0:
+                for size in IMPROVE_SIZES:
+                    result = await bench_improve(app, size, improve_requests)
+                    record(f"improve.{size}.p50", result["p50"], "s", "lower")
+                    record(f"improve.{size}.p95", result["p95"], "s", "lower")
+    return metrics
+
+
+async def run(sizes: Iterable[int], submits: int, concurrency: int, improve_requests: int) -> Dict[str, Any]:
+    settings = Settings.from_env()
+    results: Dict[str, Any] = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "storage_backend": settings.storage_backend,
+            "write_durability": settings.write_durability,
+            "llm_backend": settings.llm_backend,
+            "submits": submits,
+            "concurrency": concurrency,
+        },
+        "metrics": {},
+    }
+    for existing in sizes:
+        results["metrics"].update(await run_size(existing, submits, concurrency, improve_requests))
+    return results
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """Descriptions of the metrics that got worse than the baseline by more than ``threshold``"""
+    regressions = []
+    for name, metric in current["metrics"].items():
+        old = baseline.get("metrics", {}).get(name)
+        if old is None or not old["value"]:
+            continue
+        change = (metric["value"] - old["value"]) / old["value"]
+        worse = -change if metric["better"] == "higher" else change
+        if worse > threshold:
+            regressions.append(
+                f"{name}: {old['value']} -> {metric['value']} {metric['unit']} ({worse:+.0%} worse)"
+            )
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="In-process benchmarks of the form app")
+    parser.add_argument("--quick", action="store_true", help="smaller logs and fewer requests")
+    parser.add_argument("--sizes", help="comma-separated numbers of existing submissions")
+    parser.add_argument("--submits", type=int, help="submissions per size")
+    parser.add_argument("--concurrency", type=int, default=16, help="submissions in flight at once")
+    parser.add_argument("--improve-requests", type=int, help="requests per improvement text size")
+    parser.add_argument("--output", help="write the results to this file")
+    parser.add_argument("--baseline", help="compare against results saved earlier")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown, as a fraction")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")] if args.sizes else (QUICK_SIZES if args.quick else DEFAULT_SIZES)
+    submits = args.submits or (200 if args.quick else 1000)
+    improve_requests = args.improve_requests or (20 if args.quick else 100)
+    results = asyncio.run(run(sizes, submits, args.concurrency, improve_requests))
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
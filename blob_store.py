@@ -0,0 +1,196 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class BlobStore:
+    """
+    Content-addressed store of uploaded files.
+
+    Each distinct file content is kept once, as ``blobs/<aa>/<sha256>``. A
+    SQLite table counts how many submissions reference each blob; uploads
+    register a blob with no references, and submissions add references when
+    they are saved. ``gc`` removes blobs nobody references once they have been
+    left alone for a grace period (so an upload has time to be submitted).
+
+    Placing a blob and collecting garbage both run under the database write
+    lock, so a blob is never removed while the same content is being stored.
+    Methods block; call them from a thread, not the event loop.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.blob_dir = os.path.join(directory, "blobs")
+        self.tmp_dir = os.path.join(directory, "tmp")
+        self.path = os.path.join(directory, "blobs.db")
+        self.deduplicated = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        # The connection is shared by threadpool threads, one transaction at a time
+        self._lock = threading.Lock()
+
+    def open(self):
+        os.makedirs(self.blob_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        # Autocommit mode; transactions are started explicitly
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                refs INTEGER NOT NULL DEFAULT 0,
+                touched REAL NOT NULL
+            )
+            """
+        )
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    def temp_path(self, name: str) -> str:
+        """Where an upload writes a file before its hash is known"""
+        return os.path.join(self.tmp_dir, name)
+
+    def commit(self, temp_path: str, digest: str, size: int) -> bool:
+        """
+        Move a fully written temporary file into the store under its hash.
+
+        Returns False if the content was already stored (the temporary file is
+        dropped instead). Either way the blob's grace period starts over.
+        """
+        path = self.blob_path(digest)
+        with self._lock:
+            stored = self._place(temp_path, path, digest, size)
+        if not stored:
+            self.deduplicated += 1
+        return stored
+
+    def _place(self, temp_path: str, path: str, digest: str, size: int) -> bool:
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO blobs (hash, size, touched) VALUES (?, ?, ?) "
+                "ON CONFLICT (hash) DO UPDATE SET touched = excluded.touched",
+                (digest, size, time.time()),
+            )
+            if os.path.exists(path):
+                os.remove(temp_path)
+                stored = False
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
+                stored = True
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return stored
+
+    def _update_refs(self, digests: Iterable[str], delta: int) -> List[str]:
+        counts: Dict[str, int] = {}
+        for digest in digests:
+            counts[digest] = counts.get(digest, 0) + 1
+        with self._lock:
+            return self._apply_refs(counts, delta)
+
+    def _apply_refs(self, counts: Dict[str, int], delta: int) -> List[str]:
+        missing = []
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for digest, count in counts.items():
+                cursor = conn.execute(
+                    "UPDATE blobs SET refs = MAX(refs + ?, 0), touched = ? WHERE hash = ?",
+                    (delta * count, time.time(), digest),
+                )
+                if cursor.rowcount == 0:
+                    missing.append(digest)
+            if missing and delta > 0:
+                conn.execute("ROLLBACK")
+                return missing
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return missing
+
+    def add_refs(self, digests: Iterable[str]):
+        """Count one reference per item; all blobs must exist or nothing changes"""
+        missing = self._update_refs(digests, 1)
+        if missing:
+            raise KeyError(f"Unknown attachment {missing[0]}")
+
+    def release_refs(self, digests: Iterable[str]):
+        self._update_refs(digests, -1)
+
+    def gc(self, grace: float) -> Dict[str, int]:
+        """Remove unreferenced blobs untouched for ``grace`` seconds, and stray files"""
+        cutoff = time.time() - grace
+        with self._lock:
+            removed, freed, strays = self._collect(cutoff)
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    strays += 1
+            except FileNotFoundError:
+                pass
+        return {"removed": removed, "freed_bytes": freed, "strays": strays}
+
+    def _collect(self, cutoff: float):
+        removed = freed = strays = 0
+        conn = self._conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT hash, size FROM blobs WHERE refs <= 0 AND touched < ?", (cutoff,)
+            ).fetchall()
+            for digest, size in rows:
+                try:
+                    os.remove(self.blob_path(digest))
+                except FileNotFoundError:
+                    pass
+                conn.execute("DELETE FROM blobs WHERE hash = ?", (digest,))
+                removed += 1
+                freed += size
+            # Files left behind by interrupted uploads, or blobs the table lost track of
+            known = {digest for (digest,) in conn.execute("SELECT hash FROM blobs")}
+            for root, _, names in os.walk(self.blob_dir):
+                for name in names:
+                    path = os.path.join(root, name)
+                    if name not in known and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        strays += 1
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return removed, freed, strays
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            blobs, size, refs = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(refs), 0) FROM blobs"
+            ).fetchone()
+        return {"blobs": blobs, "bytes": size, "references": refs, "deduplicated": self.deduplicated}
+
+
+if __name__ == "__main__":
+    # Usage: python blob_store.py [upload directory] [grace seconds]
+    directory = sys.argv[1] if len(sys.argv) > 1 else "uploads"
+    grace = float(sys.argv[2]) if len(sys.argv) > 2 else 86400
+    store = BlobStore(directory)
+    store.open()
+    print(f"Garbage collection: {store.gc(grace)}")
+    store.close()
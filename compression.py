@@ -0,0 +1,175 @@
+import gzip
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Mapping, Optional
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip is offered without it
+    brotli = None
+
+# Content codings we can produce, most preferred first, with their file suffixes
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")] if brotli is not None else [("gzip", ".gz")]
+
+# Bodies smaller than this are sent as they are; compressing them saves too little
+MIN_COMPRESS_SIZE = 1024
+
+
+def accepted_encodings(header: str) -> List[str]:
+    """Our encodings the client accepts (per Accept-Encoding), most preferred first"""
+    accepted = {}
+    for item in header.split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    wildcard = accepted.get("*", 0.0)
+    return [name for name, _ in ENCODINGS if accepted.get(name, wildcard) > 0]
+
+
+def negotiate(header: str) -> Optional[str]:
+    accepted = accepted_encodings(header)
+    return accepted[0] if accepted else None
+
+
+def compress(data: bytes, encoding: str, fast: bool = False) -> bytes:
+    """Compress ``data``; ``fast`` trades some size for speed, for dynamic content"""
+    if encoding == "br":
+        return brotli.compress(data, quality=5 if fast else 11)
+    if encoding == "gzip":
+        # No timestamp, so the same input always gives the same bytes
+        return gzip.compress(data, compresslevel=6 if fast else 9, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def compress_stream(chunks: Iterator[bytes], encoding: str) -> Iterator[bytes]:
+    """Compress a streamed body; output is produced as the compressor fills its blocks"""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=5)
+        process, finish = compressor.process, compressor.finish
+    elif encoding == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        process, finish = compressor.compress, compressor.flush
+    else:
+        raise ValueError(f"Unsupported encoding: {encoding}")
+    for chunk in chunks:
+        data = process(chunk)
+        if data:
+            yield data
+    yield finish()
+
+
+def etag_matches(header: str, etags: List[str]) -> bool:
+    """Whether an If-None-Match header names one of ``etags`` (weak comparison)"""
+    if header.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in header.split(",")}
+    return any(etag in candidates for etag in etags)
+
+
+class Representation:
+    """
+    A response body with its ETag and its compressed variants.
+
+    Each variant is compressed the first time it is asked for and then kept.
+    ETags differ per encoding, but any of them revalidates the same content.
+    """
+
+    def __init__(self, body: bytes, media_type: str, fast: bool = False):
+        self.body = body
+        self.media_type = media_type
+        self.fast = fast
+        self.tag = hashlib.sha256(body).hexdigest()[:20]
+        self._encoded: Dict[str, Optional[bytes]] = {}
+        self._lock = threading.Lock()
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        return f'"{self.tag}-{encoding}"' if encoding else f'"{self.tag}"'
+
+    def encoded(self, encoding: str) -> Optional[bytes]:
+        """The body in ``encoding``, or None when compressing does not make it smaller"""
+        if encoding not in self._encoded:
+            with self._lock:
+                if encoding not in self._encoded:
+                    data = compress(self.body, encoding, fast=self.fast)
+                    self._encoded[encoding] = data if len(data) < len(self.body) else None
+        return self._encoded[encoding]
+
+    def precompress(self):
+        for encoding, _ in ENCODINGS:
+            self.encoded(encoding)
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(data) for data in self._encoded.values() if data)
+
+    def response(self, request_headers: Mapping[str, str], headers: Optional[Dict[str, str]] = None) -> Response:
+        """Response negotiated on Accept-Encoding, or 304 when If-None-Match matches"""
+        compressible = len(self.body) >= MIN_COMPRESS_SIZE
+        encoding = negotiate(request_headers.get("accept-encoding", "")) if compressible else None
+        body = self.encoded(encoding) if encoding else None
+        if body is None:
+            encoding, body = None, self.body
+        response_headers = {**(headers or {}), "etag": self.etag(encoding)}
+        if compressible:
+            response_headers["vary"] = "Accept-Encoding"
+
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match and etag_matches(if_none_match, [self.etag(None)] + [self.etag(e) for e, _ in ENCODINGS]):
+            return Response(status_code=304, headers=response_headers)
+        if encoding:
+            response_headers["content-encoding"] = encoding
+        return Response(body, media_type=self.media_type, headers=response_headers)
+
+
+class RepresentationCache:
+    """
+    Recently served dynamic bodies by content hash, so a body that has not
+    changed (e.g. the same /logs page) is not compressed again. Bounded by the
+    total bytes kept, least recently used first out.
+    """
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Representation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, body: bytes, media_type: str) -> Representation:
+        representation = Representation(body, media_type, fast=True)
+        key = f"{media_type}\0{representation.tag}"
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is not None and cached.body == body:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            self._entries[key] = representation
+            self._trim()
+        return representation
+
+    def _trim(self):
+        total = sum(entry.size for entry in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            total -= entry.size
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry.size for entry in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -1,32 +1,41 @@
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse, FileResponse
+import time
+
+# Taken before anything else is imported, so startup timings include import time
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, FileResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import uvicorn
+import asyncio
+import hmac
 import os
 import shutil
 import json
-from datetime import datetime
-from pydantic import BaseModel
-from typing import Dict, Any
-
-app = FastAPI()
-
-# Enable CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Create directories
-os.makedirs("static", exist_ok=True)
-os.makedirs("logs", exist_ok=True)
-
-# Create necessary HTML, CSS and JS files if they don't exist
-def create_files():
+import re
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Any, Callable, Iterator, Optional
+from admission import AdmissionError, create_admission
+from blob_store import BlobStore
+from compression import Representation, RepresentationCache, compress_stream, negotiate
+from schemas import FormSubmission
+from settings import Settings
+from static_assets import AssetFiles, build_assets
+from storage import SubmissionStorage, create_storage
+from submission_log import encode_record, parse_time
+from image_jobs import DERIVATIVES, ImageJobQueue
+from idempotency import KEY_PATTERN, IdempotencyError, IdempotencyTable
+from improve_cache import ImprovementCache
+from llm_backend import BackendError, create_backend
+from metrics import CONTENT_TYPE, MetricsMiddleware, Registry
+from profiling import ProfilingMiddleware, RequestProfiler, list_profiles, profile_path
+from text_rules import RuleEngine
+from uploads import StreamingUpload, UploadError
+
+# Build the HTML page, and the CSS and JS files it links, in ``directory``
+def create_files(directory: str = "static"):
     # HTML content
     html_content = """
 <!DOCTYPE html>
@@ -105,6 +114,8 @@ def create_files():
             
             <button type="button" id="addMoreBtn" class="add-more-btn">+ Ещё</button>
             
+            <button type="button" id="improveAllBtn" class="improve-all-btn">Улучшить все тексты</button>
+            
             <button type="submit" id="submitBtn" class="submit-btn">Отправить</button>
         </form>
     </div>
@@ -299,6 +310,23 @@ input[type="file"] {
     background-color: #27ae60;
 }
 
+.improve-all-btn {
+    background-color: #ecf0f1;
+    color: #2ecc71;
+    border: 2px solid #2ecc71;
+    padding: 10px 20px;
+    font-weight: bold;
+    border-radius: 4px;
+    cursor: pointer;
+    margin-bottom: 20px;
+    display: block;
+    width: 100%;
+}
+
+.improve-all-btn:hover {
+    background-color: #e9f7ef;
+}
+
 .improvement-box {
     margin-top: 15px;
     padding: 15px;
@@ -414,12 +442,18 @@ document.addEventListener('DOMContentLoaded', function() {
     const initData = tgApp.initData || '';
     const initDataUnsafe = tgApp.initDataUnsafe || {};
     const user = initDataUnsafe.user || {};
+    // Lets the server apply its rate limits per user rather than per address
+    const userHeaders = user.id ? {'X-User-Id': String(user.id)} : {};
     
     console.log('Telegram WebApp initialized', { user });
     
     let sectionCount = 1;
     const eventSectionsContainer = document.getElementById('eventSections');
     const addMoreBtn = document.getElementById('addMoreBtn');
+    const improveAllBtn = document.getElementById('improveAllBtn');
+    
+    // Improvement streams in progress by textarea id, so they can be cancelled
+    const improveStreams = {};
     const form = document.getElementById('eventForm');
     const container = document.querySelector('.container');
     
@@ -451,6 +485,10 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Reset section count
         sectionCount = 1;
+        
+        // A new filling of the form
+        idempotencyKey = newIdempotencyKey();
+        document.getElementById('submitBtn').disabled = false;
     });
     
     // Add more sections
@@ -470,6 +508,61 @@ document.addEventListener('DOMContentLoaded', function() {
         declineBtn.addEventListener('click', handleDeclineImprovement);
     });
     
+    // Improve all section descriptions with a single batch request
+    improveAllBtn.addEventListener('click', async function() {
+        const texts = {};
+        document.querySelectorAll('.event-section textarea[id^="description"]').forEach(textarea => {
+            if (textarea.value.trim()) {
+                texts[textarea.id] = textarea.value;
+            }
+        });
+        
+        if (Object.keys(texts).length === 0) {
+            tgApp.showPopup({
+                title: "Warning",
+                message: "Please enter some text before requesting improvement.",
+                buttons: [{type: "ok"}]
+            });
+            return;
+        }
+        
+        // Show loading state
+        improveAllBtn.textContent = 'Улучшаем...';
+        improveAllBtn.disabled = true;
+        
+        try {
+            const response = await fetch('/api/improve-text/batch', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    ...userHeaders,
+                },
+                body: JSON.stringify({ texts }),
+            });
+            
+            if (!response.ok) {
+                throw new Error('Failed to improve texts');
+            }
+            
+            const data = await response.json();
+            Object.entries(data.improved_texts).forEach(([textareaId, improvedText]) => {
+                showImprovement(textareaId, improvedText);
+            });
+            
+        } catch (error) {
+            console.error('Error improving texts:', error);
+            
+            // Fallback for demo - simulate improved text
+            Object.entries(texts).forEach(([textareaId, originalText]) => {
+                showImprovement(textareaId, simulateImprovedText(originalText));
+            });
+        } finally {
+            // Reset button state
+            improveAllBtn.textContent = 'Улучшить все тексты';
+            improveAllBtn.disabled = false;
+        }
+    });
+    
     // Add event listeners to initial improve buttons
     document.querySelectorAll('.improve-btn').forEach(btn => {
         btn.addEventListener('click', handleImproveText);
@@ -484,21 +577,45 @@ document.addEventListener('DOMContentLoaded', function() {
         btn.addEventListener('click', handleDeclineImprovement);
     });
     
+    // One key per filling of the form: a submit that is retried (double tap,
+    // lost response) is recognized by the server and saved only once
+    function newIdempotencyKey() {
+        return (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}${Math.random().toString(36).slice(2)}`;
+    }
+    let idempotencyKey = newIdempotencyKey();
+    
     // Form submit
     form.addEventListener('submit', async function(e) {
         e.preventDefault();
         
+        const submitBtn = document.getElementById('submitBtn');
+        if (submitBtn.disabled) {
+            return;
+        }
+        submitBtn.disabled = true;
+        
         // Create FormData object
         const formData = new FormData(form);
         
-        // Collect all form data
-        const formDataObj = {};
-        formData.forEach((value, key) => {
-            // Skip file inputs for now as they require special handling
-            if (!key.startsWith('images') && !key.startsWith('textFiles')) {
-                formDataObj[key] = value;
-            }
-        });
+        // Collect the fields of every event section (files are uploaded separately)
+        const sections = Array.from(document.querySelectorAll('.event-section'));
+        const formDataObj = {
+            events: sections.map(section => {
+                const sectionId = section.dataset.sectionId;
+                const field = name => String(formData.get(`${name}${sectionId}`) || '');
+                return {
+                    title: field('title'),
+                    link: field('link'),
+                    description: field('description'),
+                    source: field('source'),
+                    children_terms: field('childrenTerms'),
+                    message: field('message'),
+                    attachments: [],
+                };
+            }),
+        };
         
         // Add user information from Telegram if available
         if (user) {
@@ -517,11 +634,18 @@ document.addEventListener('DOMContentLoaded', function() {
         console.log('Form submission:', formDataObj);
         
         try {
+            // Upload every section's files in parallel, then reference them in the form
+            const uploads = await Promise.all(sections.map(uploadSectionFiles));
+            uploads.forEach((files, i) => {
+                formDataObj.events[i].attachments = files;
+            });
+            
             // Send to backend to save to JSON file
             const response = await fetch('/api/submit-form', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Idempotency-Key': idempotencyKey,
                 },
                 body: JSON.stringify(formDataObj),
             });
@@ -536,6 +660,10 @@ document.addEventListener('DOMContentLoaded', function() {
             // Send data to Telegram WebApp
             tgApp.sendData(JSON.stringify(formDataObj));
             
+            // This filling is saved; the next one gets its own key
+            idempotencyKey = newIdempotencyKey();
+            submitBtn.disabled = false;
+            
             // Hide form and show thank you message
             form.style.display = 'none';
             thankYouDiv.style.display = 'block';
@@ -548,16 +676,52 @@ document.addEventListener('DOMContentLoaded', function() {
             
         } catch (error) {
             console.error('Error submitting form:', error);
+            submitBtn.disabled = false;
             
             // Show error message
             tgApp.showPopup({
                 title: "Error",
-                message: "Failed to submit form. Please try again.",
+                message: error.uploadError || "Failed to submit form. Please try again.",
                 buttons: [{type: "ok"}]
             });
         }
     });
     
+    // Function to upload the images and text files of one section
+    async function uploadSectionFiles(section) {
+        const sectionId = section.dataset.sectionId;
+        const body = new FormData();
+        let count = 0;
+        
+        ['images', 'textFiles'].forEach(prefix => {
+            const input = section.querySelector(`#${prefix}${sectionId}`);
+            Array.from(input.files).forEach(file => {
+                body.append(input.name, file);
+                count++;
+            });
+        });
+        
+        if (count === 0) {
+            return [];
+        }
+        
+        const response = await fetch('/api/upload', {
+            method: 'POST',
+            headers: userHeaders,
+            body: body,
+        });
+        
+        if (!response.ok) {
+            const data = await response.json().catch(() => ({}));
+            const error = new Error('Failed to upload files');
+            error.uploadError = data.detail;
+            throw error;
+        }
+        
+        const data = await response.json();
+        return data.files;
+    }
+    
     // Function to handle text improvement request
     async function handleImproveText(e) {
         const textareaId = e.target.getAttribute('data-for');
@@ -578,52 +742,113 @@ document.addEventListener('DOMContentLoaded', function() {
         e.target.disabled = true;
         
         try {
-            // Send text to backend for improvement
-            const response = await fetch('/api/improve-text', {
+            // Send text to backend for improvement, streamed back as it is generated
+            const controller = new AbortController();
+            improveStreams[textareaId] = controller;
+            
+            const response = await fetch('/api/improve-text/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    ...userHeaders,
                 },
                 body: JSON.stringify({ text: originalText }),
+                signal: controller.signal,
             });
             
-            if (!response.ok) {
+            if (!response.ok || !response.body) {
                 throw new Error('Failed to improve text');
             }
             
-            const data = await response.json();
-            
-            // Show improvement box with improved text
-            const improvementBox = document.getElementById(`improvement-box-${textareaId}`);
-            const improvedTextElement = document.getElementById(`improved-${textareaId}`);
-            
-            improvedTextElement.textContent = data.improved_text;
-            improvementBox.style.display = 'block';
+            // Show improvement box and fill it in as chunks arrive
+            showImprovement(textareaId, '');
+            await readImprovementStream(response, document.getElementById(`improved-${textareaId}`));
             
         } catch (error) {
+            if (error.name === 'AbortError') {
+                // Cancelled by accepting or declining the suggestion
+                return;
+            }
+            
             console.error('Error improving text:', error);
             
             // Fallback for demo - simulate improved text
             const improvedText = simulateImprovedText(originalText);
             
             // Show improvement box with fallback improved text
-            const improvementBox = document.getElementById(`improvement-box-${textareaId}`);
-            const improvedTextElement = document.getElementById(`improved-${textareaId}`);
-            
-            improvedTextElement.textContent = improvedText;
-            improvementBox.style.display = 'block';
+            showImprovement(textareaId, improvedText);
         } finally {
+            delete improveStreams[textareaId];
+            
             // Reset button state
             e.target.textContent = 'Улучшить текст';
             e.target.disabled = false;
         }
     }
     
+    // Function to render an improvement stream (Server-Sent Events) into an element
+    async function readImprovementStream(response, element) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) {
+                return;
+            }
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Handle every complete event in the buffer
+            let boundary;
+            while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                const message = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                message.split('\\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        event = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                });
+                
+                const payload = data ? JSON.parse(data) : {};
+                if (event === 'done') {
+                    return;
+                } else if (event === 'replace') {
+                    element.textContent = payload.text;
+                } else if (payload.delta) {
+                    element.textContent += payload.delta;
+                }
+            }
+        }
+    }
+    
+    // Function to cancel an improvement that is still streaming
+    function cancelImprovement(textareaId) {
+        if (improveStreams[textareaId]) {
+            improveStreams[textareaId].abort();
+        }
+    }
+    
+    // Function to show a suggested text in the improvement box of a textarea
+    function showImprovement(textareaId, improvedText) {
+        const improvementBox = document.getElementById(`improvement-box-${textareaId}`);
+        const improvedTextElement = document.getElementById(`improved-${textareaId}`);
+        
+        improvedTextElement.textContent = improvedText;
+        improvementBox.style.display = 'block';
+    }
+    
     // Function to handle accepting text improvement
     function handleAcceptImprovement(e) {
         const textareaId = e.target.getAttribute('data-for');
         const textarea = document.getElementById(textareaId);
         const improvedText = document.getElementById(`improved-${textareaId}`).textContent;
+        cancelImprovement(textareaId);
         
         // Replace original text with improved text
         textarea.value = improvedText;
@@ -635,6 +860,7 @@ document.addEventListener('DOMContentLoaded', function() {
     // Function to handle declining text improvement
     function handleDeclineImprovement(e) {
         const textareaId = e.target.getAttribute('data-for');
+        cancelImprovement(textareaId);
         
         // Hide improvement box
         document.getElementById(`improvement-box-${textareaId}`).style.display = 'none';
@@ -737,34 +963,311 @@ document.addEventListener('DOMContentLoaded', function() {
 
     """
     
-    # Write the files
-    with open("static/styles.css", "w", encoding="utf-8") as f:
-        f.write(css_content)
+    # Build fingerprinted, precompressed assets (unchanged files are not rewritten)
+    manifest = build_assets(directory, {"styles.css": css_content, "script.js": js_content})
     
-    with open("static/script.js", "w", encoding="utf-8") as f:
-        f.write(js_content)
+    # Point the page at the built names
+    for name, built in manifest.items():
+        html_content = html_content.replace(f"/static/{name}", f"/static/{built}")
     
     return html_content
 
-# Create the necessary files
-html_content = create_files()
+class Services:
+    """
+    Everything the endpoints share. Creating it is cheap and touches no files
+    or connections; the heavy work happens in start(), run by the lifespan.
+    """
+    
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        
+        # Where submissions are persisted (STORAGE_BACKEND=json or sqlite)
+        self.storage = create_storage(settings)
+        
+        # Compiled text improvement rules (TEXT_RULES_FILE), hot-reloaded on change
+        self.text_rules = RuleEngine(settings.text_rules_file)
+        
+        # Text improvement backend (LLM_BACKEND=rules or http); the rule engine is the fallback
+        self.llm = create_backend(settings, self.text_rules)
+        
+        # Improved texts by input and backend version; identical concurrent requests share one computation
+        self.improve_cache = ImprovementCache(maxsize=settings.improve_cache_size, ttl=settings.improve_cache_ttl)
+        
+        # Uploaded attachments, stored once per distinct content and referenced by hash
+        self.blobs = BlobStore(settings.upload_dir)
+        
+        # Thumbnails and normalized re-encodes of uploaded images, made on a process pool
+        self.image_jobs = ImageJobQueue(self.blobs, workers=settings.image_workers)
+        
+        # Results of submissions by idempotency key, so retried submits are not saved twice
+        self.idempotency = IdempotencyTable(
+            os.path.join(settings.log_dir, "idempotency.db"),
+            window=settings.idempotency_window,
+            maxsize=settings.idempotency_cache_size,
+        )
+        
+        # Per-user rate limits by route, and load shedding
+        self.admission = create_admission({
+            "submit": (settings.submit_rate, settings.submit_burst),
+            "improve": (settings.improve_rate, settings.improve_burst),
+            "upload": (settings.upload_rate, settings.upload_burst),
+        }, settings.rate_limit_clients, settings.address_rate_factor)
+        # Texts being improved right now, across all improvement endpoints
+        self.improving = 0
+        
+        # Exported at /metrics; request metrics are fed by MetricsMiddleware
+        self.metrics = Registry()
+        self.request_latency = self.metrics.histogram(
+            "http_request_duration_seconds", "Time to serve a request", ("method", "route")
+        )
+        self.responses = self.metrics.counter(
+            "http_responses_total", "Responses sent, by status code", ("method", "route", "status")
+        )
+        self.improve_latency = self.metrics.histogram(
+            "improve_duration_seconds", "Time to improve one text", ("backend", "outcome")
+        )
+        self.log_bytes = self.metrics.gauge("submission_log_bytes", "Size of the submission log")
+        self.log_records = self.metrics.gauge("submission_log_records", "Submissions in the log")
+        self.metrics.gauge(
+            "write_queue_depth", "Submissions waiting to be written",
+            collect=lambda: self.storage.write_queue.depth(),
+        )
+        self.metrics.gauge(
+            "improvements_in_flight", "Texts being improved", collect=lambda: self.improving
+        )
+        
+        # Profiles of selected requests, when enabled
+        self.profile_dir = os.path.join(settings.log_dir, "profiles")
+        self.profiler: Optional[RequestProfiler] = None
+        if settings.profile_mode != "off":
+            self.profiler = RequestProfiler(
+                self.profile_dir,
+                settings.profile_mode,
+                sample_rate=settings.profile_sample_rate,
+                keep=settings.profile_keep,
+                token=settings.admin_token,
+            )
+        
+        # Compressed variants of dynamic responses, reused while their content is unchanged
+        self.response_cache = RepresentationCache(max_bytes=settings.response_cache_bytes)
+        
+        # The encoded root page with its ETag and compressed variants, prepared at startup
+        self.root_page: Optional[Representation] = None
+        
+        # Seconds spent in each startup phase, for tracking cold starts
+        self.startup: Dict[str, Any] = {}
+        self._blob_gc_task: Optional[asyncio.Task] = None
+        self._rules_task: Optional[asyncio.Task] = None
+        self._compaction_task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+    
+    def build_root_page(self):
+        html_content = create_files(self.settings.static_dir)
+        self.root_page = Representation(html_content.encode("utf-8"), "text/html")
+        self.root_page.precompress()
+    
+    async def _timed(self, phases: Dict[str, float], name: str, setup: Callable[[], Any]):
+        started = time.perf_counter()
+        await run_in_threadpool(setup)
+        phases[name] = round(time.perf_counter() - started, 4)
+    
+    async def start(self):
+        started = time.perf_counter()
+        phases: Dict[str, float] = {}
+        # Independent blocking setup runs side by side in the threadpool
+        await asyncio.gather(
+            self._timed(phases, "assets", self.build_root_page),
+            self._timed(phases, "storage", self.storage.open),
+            self._timed(phases, "attachments", self.blobs.open),
+            self._timed(phases, "idempotency", self.idempotency.open),
+            self._timed(phases, "text_rules", self.text_rules.current),
+        )
+        await self.storage.start()
+        await self.llm.start()
+        self.image_jobs.start()
+        self._stopping.clear()
+        self._blob_gc_task = asyncio.create_task(self.collect_blobs())
+        self._rules_task = asyncio.create_task(self.reload_text_rules())
+        if self.settings.compaction_interval > 0:
+            self._compaction_task = asyncio.create_task(self.compact_log())
+        ready = time.perf_counter()
+        self.startup = {
+            "phases": phases,
+            "startup_seconds": round(ready - started, 4),
+            # From the first import of this module; covers the whole cold start of a worker
+            "ready_seconds": round(ready - IMPORT_STARTED, 4),
+        }
+    
+    async def stop(self):
+        self.image_jobs.stop()
+        # The periodic tasks use storage, blobs and rules from the threadpool;
+        # let any run in progress finish before closing what it uses
+        self._stopping.set()
+        for task in (self._blob_gc_task, self._compaction_task, self._rules_task):
+            if task is not None:
+                await task
+        self._blob_gc_task = self._compaction_task = self._rules_task = None
+        # Then drain the write queue, before closing what pending submits still use
+        await self.storage.stop()
+        self.storage.close()
+        self.blobs.close()
+        self.idempotency.close()
+        await self.llm.close()
+    
+    async def collect_blobs(self):
+        """Remove unreferenced attachments periodically"""
+        while not self._stopping.is_set():
+            try:
+                result = await run_in_threadpool(self.blobs.gc, self.settings.blob_gc_grace)
+                if result["removed"] or result["strays"]:
+                    result["derivatives"] = await run_in_threadpool(self.image_jobs.prune)
+                    print(f"Attachment garbage collection: {result}")
+            except Exception as e:
+                print(f"Error collecting attachments: {str(e)}")
+            await self._pause(self.settings.blob_gc_interval)
+
+    async def reload_text_rules(self):
+        """
+        Pick up changes to the rules file in the threadpool, so the cache key
+        (the rules version) changes without compiling rules on the event loop
+        """
+        while not self._stopping.is_set():
+            try:
+                await run_in_threadpool(self.text_rules.current)
+            except Exception as e:
+                print(f"Error reloading text rules: {str(e)}")
+            await self._pause(self.text_rules.check_interval)
 
-# Mount static files directory
-app.mount("/static", StaticFiles(directory="static"), name="static")
+    async def compact_log(self):
+        """Archive past days of the submission log periodically"""
+        while not self._stopping.is_set():
+            try:
+                result = await run_in_threadpool(self.storage.compact)
+                if result.get("segments"):
+                    print(f"Submission log compaction: {result}")
+            except Exception as e:
+                print(f"Error compacting submission log: {str(e)}")
+            await self._pause(self.settings.compaction_interval)
+
+    async def _pause(self, seconds: float):
+        """Wait between runs of a periodic task, waking early when stopping"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+def get_services(request: Request) -> Services:
+    return request.app.state.services
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    services = app.state.services
+    await services.start()
+    startup = services.startup
+    print(f"Ready in {startup['ready_seconds']:.3f}s (startup {startup['startup_seconds']:.3f}s: {startup['phases']})")
+    try:
+        yield
+    finally:
+        await services.stop()
+
+router = APIRouter()
+
+def create_app(settings: Optional[Settings] = None) -> FastAPI:
+    """
+    Build the application. Nothing is read, written or connected here; that
+    happens when the app starts (see Services.start), so creating an app is
+    fast and works on a read-only filesystem.
+    """
+    settings = settings or Settings.from_env()
+    app = FastAPI(lifespan=lifespan)
+    services = app.state.services = Services(settings)
+    
+    # Enable CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    if services.profiler is not None:
+        app.add_middleware(ProfilingMiddleware, profiler=services.profiler)
+    # Outermost, so the time includes the other middleware
+    app.add_middleware(MetricsMiddleware, latency=services.request_latency, responses=services.responses)
+    
+    app.include_router(router)
+    
+    # Mount static files directory (built assets are served precompressed and cached forever)
+    app.mount("/static", AssetFiles(directory=settings.static_dir, check_dir=False), name="static")
+    
+    return app
+
+# Seconds a shed client is asked to wait; the backlog usually drains within that
+SHED_RETRY_AFTER = 2
+
+def client_address(request: Request) -> str:
+    # Behind a proxy, run uvicorn with --proxy-headers so this is the real client
+    return f"ip:{request.client.host if request.client else ''}"
+
+def client_key(request: Request, user_id: Any = None) -> str:
+    """
+    Whom a request is counted against: the Telegram user, else the client
+    address. User ids are the client's word, so admit() limits the address too.
+    """
+    if user_id in (None, ""):
+        user_id = request.headers.get("x-user-id")
+    if user_id:
+        return f"user:{user_id}"
+    return client_address(request)
+
+def admit(services: Services, request: Request, route: str, user_id: Any = None, cost: int = 1):
+    """Raise 429 (with Retry-After) if the server is overloaded or the client over its rate"""
+    settings = services.settings
+    try:
+        if route == "submit" and services.storage.write_queue.depth() >= settings.shed_write_backlog:
+            services.admission.shed("Too many submissions waiting to be saved", SHED_RETRY_AFTER)
+        if route == "improve" and services.improving >= settings.shed_improve_in_flight:
+            services.admission.shed("Too many texts being improved", SHED_RETRY_AFTER)
+        services.admission.admit(route, client_key(request, user_id), cost, client_address(request))
+    except AdmissionError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
 
 class TextImproveRequest(BaseModel):
     text: str
 
-class FormSubmissionRequest(BaseModel):
-    user: Dict[str, Any] = None
-    submission_time: str = None
+class BatchTextImproveRequest(BaseModel):
+    # Section textarea id (e.g. "description2") -> text
+    texts: Dict[str, str]
 
-@app.get("/", response_class=HTMLResponse)
-async def read_root():
-    return html_content
+@router.get("/", response_class=HTMLResponse)
+async def read_root(request: Request, services: Services = Depends(get_services)):
+    # Revalidated on every visit (cheap with the ETag); the assets it links are immutable
+    return services.root_page.response(request.headers, {"cache-control": "no-cache"})
+
+# Upper bound on sections per batch request
+MAX_BATCH_TEXTS = 50
+
+async def improve_one(services: Services, text: str) -> str:
+    """Improve a text with the configured backend, through the result cache"""
+    improve_cache, llm = services.improve_cache, services.llm
+    key = improve_cache.make_key(text, llm.version)
+    services.improving += 1
+    started, outcome = time.perf_counter(), "ok"
+    try:
+        return await improve_cache.get_or_compute(key, lambda: llm.improve(text))
+    except BackendError as e:
+        # Fall back to the rule-based function; not cached, so the model is used again once it recovers
+        print(f"Text improvement backend failed, using fallback: {str(e)}")
+        llm.fallbacks += 1
+        outcome = "fallback"
+        return await run_in_threadpool(improve_text_with_llm, text, services.text_rules)
+    finally:
+        services.improving -= 1
+        services.improve_latency.observe(time.perf_counter() - started, llm.name, outcome)
 
-@app.post("/api/improve-text")
-async def improve_text(request: TextImproveRequest):
+@router.post("/api/improve-text")
+async def improve_text(request: TextImproveRequest, http_request: Request, services: Services = Depends(get_services)):
+    admit(services, http_request, "improve")
     try:
         original_text = request.text
         
@@ -772,130 +1275,360 @@ async def improve_text(request: TextImproveRequest):
             raise HTTPException(status_code=400, detail="No text provided")
         
         # Improve the text with a dummy function (placeholder for LLM integration)
-        improved_text = improve_text_with_llm(original_text)
+        improved_text = await improve_one(services, original_text)
         
         return JSONResponse(content={"improved_text": improved_text})
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/api/submit-form")
-async def submit_form(request: Request):
+def sse_event(data: dict, event: Optional[str] = None) -> str:
+    """Format one Server-Sent Event"""
+    head = f"event: {event}\n" if event else ""
+    return head + f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def improvement_events(services: Services, text: str):
+    """
+    Improved text as SSE: ``{"delta"}`` chunks, then a ``done`` event. If the
+    backend fails, a ``replace`` event carries the full fallback text instead.
+    When the client disconnects this generator is cancelled, which closes the
+    backend stream and stops the work there too.
+    """
+    improve_cache, llm = services.improve_cache, services.llm
+    key = improve_cache.make_key(text, llm.version)
+    cached = improve_cache.lookup(key)
+    if cached is not None:
+        yield sse_event({"delta": cached})
+        yield sse_event({}, "done")
+        return
+    
+    parts = []
+    services.improving += 1
+    started, outcome = time.perf_counter(), "ok"
     try:
-        form_data = await request.json()
-        
-        # Generate a timestamp-based filename
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        user_id = form_data.get("user", {}).get("id", "unknown")
-        filename = f"logs/form_submission_{user_id}_{timestamp}.json"
+        async for delta in llm.stream(text):
+            parts.append(delta)
+            yield sse_event({"delta": delta})
+    except BackendError as e:
+        print(f"Text improvement backend failed, using fallback: {str(e)}")
+        llm.fallbacks += 1
+        outcome = "fallback"
+        yield sse_event({"text": await run_in_threadpool(improve_text_with_llm, text, services.text_rules)}, "replace")
+    else:
+        improve_cache.store(key, "".join(parts))
+    finally:
+        services.improving -= 1
+        services.improve_latency.observe(time.perf_counter() - started, llm.name, outcome)
+    yield sse_event({}, "done")
+
+@router.post("/api/improve-text/stream")
+async def improve_text_stream(request: TextImproveRequest, http_request: Request, services: Services = Depends(get_services)):
+    """Streaming variant of /api/improve-text over Server-Sent Events"""
+    if not request.text:
+        raise HTTPException(status_code=400, detail="No text provided")
+    admit(services, http_request, "improve")
+    
+    return StreamingResponse(
+        improvement_events(services, request.text),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.post("/api/improve-text/batch")
+async def improve_text_batch(request: BatchTextImproveRequest, http_request: Request, services: Services = Depends(get_services)):
+    """Improve the texts of several form sections in one round-trip, concurrently"""
+    if not request.texts:
+        raise HTTPException(status_code=400, detail="No texts provided")
+    if len(request.texts) > MAX_BATCH_TEXTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_TEXTS} texts per request")
+    # Each text counts as one request
+    admit(services, http_request, "improve", cost=len(request.texts))
+    
+    try:
+        section_ids = list(request.texts)
+        improved = await asyncio.gather(*(improve_one(services, request.texts[section_id]) for section_id in section_ids))
+        return JSONResponse(content={"improved_texts": dict(zip(section_ids, improved))})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/api/upload")
+async def upload_files(request: Request, services: Services = Depends(get_services)):
+    """
+    Receive one section's images and text files (multipart/form-data)
+    
+    Files are streamed to disk part by part while the body is read; the size
+    and count limits are enforced as the data arrives. Returns the stored file
+    references (by SHA-256) to include in the submitted form. Thumbnails of
+    images are made in the background, see /api/images/{sha256}.
+    """
+    settings = services.settings
+    admit(services, request, "upload")
+    # Reject bodies that cannot fit within the limits before reading them
+    max_body = 2 * settings.upload_max_files * settings.upload_max_file_size + 1024 * 1024
+    if int(request.headers.get("content-length") or 0) > max_body:
+        raise HTTPException(status_code=413, detail="Upload is too large")
+    
+    upload = StreamingUpload(services.blobs, settings.upload_max_file_size, settings.upload_max_files)
+    try:
+        await upload.receive(request.headers.get("content-type", ""), request.stream())
+    except UploadError as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+    
+    files = upload.result()
+    for file in files:
+        if file["image_format"]:
+            try:
+                services.image_jobs.submit(file["sha256"])
+            except Exception as e:
+                print(f"Error queueing image derivatives: {str(e)}")
+    
+    return JSONResponse(content={"files": files})
+
+@router.get("/api/images/{digest}")
+async def get_image_job(digest: str, services: Services = Depends(get_services)):
+    """State of the thumbnail and re-encode job of an uploaded image"""
+    status = await run_in_threadpool(services.image_jobs.status, digest)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Unknown image")
+    return JSONResponse(content=status)
+
+@router.get("/api/images/{digest}/{kind}")
+async def get_image_derivative(digest: str, kind: str, services: Services = Depends(get_services)):
+    """A finished derivative (thumbnail or normalized) of an uploaded image"""
+    if kind not in DERIVATIVES or not re.fullmatch(r"[0-9a-f]{64}", digest):
+        raise HTTPException(status_code=404, detail="Unknown derivative")
+    path = services.image_jobs.derivative_path(digest, kind)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Derivative is not ready")
+    # Named by the content it was made from, so it never changes
+    return FileResponse(path, media_type="image/jpeg", headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+# Largest submission body accepted; the schema limits each field well below this
+MAX_SUBMISSION_BYTES = 1024 * 1024
+
+@router.post("/api/submit-form")
+async def submit_form(request: Request, services: Services = Depends(get_services)):
+    """
+    Save a submission (see schemas.FormSubmission for its structure)
+    
+    The raw body is parsed and validated in one pass by pydantic-core; invalid
+    submissions are answered with 422 and the list of problems. With an
+    ``Idempotency-Key`` header, repeats of the same submission get the
+    original response (marked ``Idempotent-Replayed: true``) and are not saved
+    again.
+    """
+    key = request.headers.get("idempotency-key")
+    if key is not None and not KEY_PATTERN.match(key):
+        raise HTTPException(status_code=400, detail="Invalid Idempotency-Key")
+    if int(request.headers.get("content-length") or 0) > MAX_SUBMISSION_BYTES:
+        raise HTTPException(status_code=413, detail="Submission is too large")
+    # Chunked bodies have no Content-Length; count the bytes as they arrive
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > MAX_SUBMISSION_BYTES:
+            raise HTTPException(status_code=413, detail="Submission is too large")
+    try:
+        submission = FormSubmission.model_validate_json(body)
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=[
+            {"loc": list(error["loc"]), "msg": error["msg"], "type": error["type"]}
+            for error in e.errors(include_url=False)
+        ])
+    blobs = services.blobs
+    
+    async def save_submission():
+        # Charged only when the submission is saved, not when a stored reply is replayed
+        admit(services, request, "submit", submission.user.id if submission.user else None)
         
-        # Save to JSON file
-        with open(filename, "w", encoding="utf-8") as f:
-            json.dump(form_data, f, ensure_ascii=False, indent=2)
+        # Reference the uploaded attachments, so they are kept
+        hashes = submission.attachment_hashes()
+        try:
+            if hashes:
+                await run_in_threadpool(blobs.add_refs, hashes)
+        except KeyError as e:
+            raise HTTPException(status_code=400, detail=str(e).strip("'"))
         
-        # Log to a common log file as well
-        append_to_log(form_data)
+        # Hand off to the storage backend's background writer
+        try:
+            saved = await services.storage.save(submission)
+        except BaseException:
+            if hashes:
+                await run_in_threadpool(blobs.release_refs, hashes)
+            raise
         
-        return JSONResponse(content={
+        return {
             "status": "success", 
             "message": "Form data saved successfully",
-            "filename": filename
-        })
-    except Exception as e:
-        print(f"Error saving form data: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
-
-def append_to_log(form_data: dict):
-    """Append form submission to a common log file"""
-    log_file = "logs/all_submissions.json"
+            **saved
+        }
     
     try:
-        # Read existing logs
-        if os.path.exists(log_file):
-            with open(log_file, "r", encoding="utf-8") as f:
-                try:
-                    logs = json.load(f)
-                except json.JSONDecodeError:
-                    logs = []
-        else:
-            logs = []
-        
-        # Append new submission
-        logs.append(form_data)
-        
-        # Write back to file
-        with open(log_file, "w", encoding="utf-8") as f:
-            json.dump(logs, f, ensure_ascii=False, indent=2)
-            
+        if key is None:
+            return JSONResponse(content=await save_submission())
+        
+        # A retried submit (double tap, lost response) gets the first response back
+        try:
+            result, replayed = await services.idempotency.run(key, submission.fingerprint(), save_submission)
+        except IdempotencyError as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+        headers = {"Idempotent-Replayed": "true"} if replayed else None
+        return JSONResponse(content=result, headers=headers)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error appending to log file: {str(e)}")
+        print(f"Error saving form data: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-def improve_text_with_llm(text: str) -> str:
+def improve_text_with_llm(text: str, text_rules: RuleEngine) -> str:
     """
     Dummy function to simulate text improvement with an LLM.
     In a real application, this would call an actual LLM API.
+    
+    Replacements, sentence capitalization and paragraph grouping are applied
+    in a single pass by the compiled rule set (see text_rules.py).
     """
     if not text:
         return ""
     
-    # Simple improvements for demonstration
-    improved = text.strip()
-    
-    # Capitalize first letter of each sentence
-    improved = '. '.join(s.capitalize() for s in improved.split('. '))
-    
-    # Ensure the first letter of the text is capitalized
-    if improved:
-        improved = improved[0].upper() + improved[1:]
-    
-    # Add some enhancements
-    if len(improved) < 100:
-        improved += " Это захватывающее событие обещает стать незабываемым для всех посетителей."
-    
-    # Replace some common words with more expressive ones
-    replacements = {
-        "хорошо": "превосходно",
-        "интересно": "захватывающе",
-        "важно": "исключительно важно",
-        "событие": "мероприятие",
-        "красивый": "великолепный",
-        "большой": "масштабный"
-    }
+    return text_rules.improve(text)
+
+@router.get("/metrics")
+async def get_metrics(request: Request, services: Services = Depends(get_services)):
+    """Request latencies, status counts and storage gauges in the Prometheus text format (requires X-Admin-Token)"""
+    require_admin(request, services)
+    usage = await run_in_threadpool(services.storage.usage)
+    services.log_bytes.set(usage["bytes"])
+    services.log_records.set(usage["records"])
+    return Response(services.metrics.render(), media_type=CONTENT_TYPE)
+
+def require_admin(request: Request, services: Services):
+    token = services.settings.admin_token
+    given = request.headers.get("x-admin-token", "")
+    if not token or not hmac.compare_digest(given.encode("utf-8"), token.encode("utf-8")):
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+@router.get("/admin/profiles")
+async def get_profiles(request: Request, services: Services = Depends(get_services)):
+    """Saved request profiles, newest first (requires X-Admin-Token)"""
+    require_admin(request, services)
+    profiler = services.profiler
+    return JSONResponse(content={
+        **(profiler.stats() if profiler else {"mode": "off"}),
+        "profiles": await run_in_threadpool(list_profiles, services.profile_dir),
+    })
+
+@router.get("/admin/profiles/{name}")
+async def download_profile(name: str, request: Request, services: Services = Depends(get_services)):
+    """One profile file: .prof (pstats), .tracemalloc (Snapshot.load) or .txt summary"""
+    require_admin(request, services)
+    path = profile_path(services.profile_dir, name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Unknown profile")
+    media_type = "text/plain" if name.endswith(".txt") else "application/octet-stream"
+    return FileResponse(path, media_type=media_type, filename=name)
+
+@router.get("/api/status")
+async def get_status(services: Services = Depends(get_services)):
+    """Operational counters, e.g. how many submissions are waiting to be written"""
+    return JSONResponse(content={
+        **services.storage.stats(),
+        "improve_cache": services.improve_cache.stats(),
+        "llm": services.llm.stats(),
+        "attachments": await run_in_threadpool(services.blobs.stats),
+        "image_jobs": services.image_jobs.stats(),
+        "response_cache": services.response_cache.stats(),
+        "idempotency": services.idempotency.stats(),
+        "admission": {**services.admission.stats(), "improving": services.improving},
+        "startup": services.startup,
+    })
+
+# Page size of /logs in JSON mode (NDJSON mode streams everything unless limited)
+LOGS_DEFAULT_LIMIT = 100
+LOGS_MAX_LIMIT = 1000
+
+def read_logs_page(storage: SubmissionStorage, limit: int, **filters) -> dict:
+    logs = []
+    cursor = None
+    for cursor, record in storage.iter_logs(**filters):
+        logs.append(record)
+        if len(logs) == limit:
+            break
+    else:
+        cursor = None
+    return {"logs": logs, "next": cursor}
+
+def logs_page_response(services: Services, request_headers, limit: int, **filters) -> Response:
+    page = read_logs_page(services.storage, limit, **filters)
+    body = json.dumps(page, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return services.response_cache.get(body, "application/json").response(request_headers)
+
+def stream_logs(storage: SubmissionStorage, limit: Optional[int], **filters) -> Iterator[bytes]:
+    for count, (_, record) in enumerate(storage.iter_logs(**filters), 1):
+        yield encode_record(record)
+        if count == limit:
+            break
+
+@router.get("/logs")
+async def get_logs(
+    request: Request,
+    limit: Optional[int] = None,
+    after: Optional[str] = None,
+    offset: Optional[int] = None,
+    user_id: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    format: str = "json",
+    services: Services = Depends(get_services),
+):
+    """
+    API endpoint to retrieve logs (useful for debugging or admin purposes)
     
-    for word, replacement in replacements.items():
-        improved = improved.replace(word, replacement)
+    Results are paginated: pass the returned ``next`` cursor as ``after`` to get
+    the following page, or ``offset`` to start at that many records into the
+    log (``offset=N-1&limit=1`` is submission #N) without reading the records
+    before it. ``user_id`` and the ``since``/``until`` range (ISO 8601, on
+    submission_time) filter the records. ``format=ndjson`` streams one record
+    per line as it is read instead of returning a page. Large responses are
+    compressed when the client accepts it, and pages carry an ETag.
+    """
+    try:
+        filters = {
+            "after": services.storage.parse_cursor(after) if after else None,
+            "user_id": user_id,
+            "since": parse_time(since) if since else None,
+            "until": parse_time(until) if until else None,
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid parameter: {str(e)}")
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="format must be json or ndjson")
+    if limit is not None and limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    if offset is not None:
+        if offset < 0:
+            raise HTTPException(status_code=400, detail="offset must not be negative")
+        if after or user_id is not None or since or until:
+            raise HTTPException(status_code=400, detail="offset cannot be combined with after or filters")
+        filters["after"] = await run_in_threadpool(services.storage.seek, offset)
     
-    # Add more structure if the text is long enough
-    if len(improved) > 200:
-        sentences = improved.split('. ')
-        if len(sentences) > 3:
-            # Group sentences into paragraphs
-            paragraphs = []
-            current_paragraph = []
-            
-            for i, sentence in enumerate(sentences):
-                current_paragraph.append(sentence)
-                if (i + 1) % 3 == 0 or i == len(sentences) - 1:
-                    paragraphs.append('. '.join(current_paragraph) + '.')
-                    current_paragraph = []
-            
-            improved = '\n\n'.join(paragraphs)
+    if format == "ndjson":
+        records = stream_logs(services.storage, limit, **filters)
+        encoding = negotiate(request.headers.get("accept-encoding", ""))
+        if encoding is None:
+            return StreamingResponse(records, media_type="application/x-ndjson")
+        return StreamingResponse(
+            compress_stream(records, encoding),
+            media_type="application/x-ndjson",
+            headers={"content-encoding": encoding, "vary": "Accept-Encoding"},
+        )
     
-    return improved
-
-@app.get("/logs")
-async def get_logs():
-    """API endpoint to retrieve logs (useful for debugging or admin purposes)"""
     try:
-        log_file = "logs/all_submissions.json"
-        if not os.path.exists(log_file):
-            return JSONResponse(content={"logs": []})
-            
-        with open(log_file, "r", encoding="utf-8") as f:
-            logs = json.load(f)
-        
-        return JSONResponse(content={"logs": logs})
+        limit = min(limit or LOGS_DEFAULT_LIMIT, LOGS_MAX_LIMIT)
+        return await run_in_threadpool(logs_page_response, services, request.headers, limit, **filters)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+app = create_app()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8080)
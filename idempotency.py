@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+# Keys are opaque client-generated tokens, e.g. UUIDs
+KEY_PATTERN = re.compile(r"^[A-Za-z0-9_.:-]{8,128}$")
+
+# A claim older than this whose request never finished (the worker died) may be taken over
+PENDING_TIMEOUT = 60.0
+
+
+class IdempotencyError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class IdempotencyTable:
+    """
+    Results of requests by idempotency key, so a repeated request gets the
+    original result instead of being carried out again.
+
+    Keys are remembered for ``window`` seconds. Recent results are kept in a
+    bounded in-memory LRU; all of them are persisted in SQLite, which is shared
+    by the workers and survives restarts. A key is claimed in the database
+    before the request runs: a repeat that arrives while the original is still
+    running waits for it in the same worker and gets 409 from another one.
+    Each key is tied to a fingerprint of its request; reusing a key for a
+    different request is an error.
+    """
+
+    def __init__(self, path: str, window: float = 86400, maxsize: int = 10000):
+        self.path = path
+        self.window = window
+        self.maxsize = maxsize
+        self._memory: "OrderedDict[str, Tuple[float, str, Dict[str, Any]]]" = OrderedDict()
+        self._inflight: Dict[str, Tuple[str, asyncio.Future]] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._purged = 0.0
+        self.replayed = 0
+        self.conflicts = 0
+
+    def open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS idempotency (
+                key TEXT PRIMARY KEY,
+                fingerprint TEXT NOT NULL,
+                created REAL NOT NULL,
+                result TEXT
+            )
+            """
+        )
+        self._purge(time.time())
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _purge(self, now: float):
+        self._conn.execute("DELETE FROM idempotency WHERE created < ?", (now - self.window,))
+        self._purged = now
+
+    def _claim(self, key: str, fingerprint: str) -> Tuple[str, Optional[str], Optional[Dict[str, Any]]]:
+        """("claimed", ...) if the request should run, else ("done"/"pending", fingerprint, result)"""
+        now = time.time()
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if now - self._purged >= 60:
+                    self._purge(now)
+                row = conn.execute(
+                    "SELECT fingerprint, created, result FROM idempotency WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None or (row[2] is None and now - row[1] >= PENDING_TIMEOUT):
+                    conn.execute(
+                        "INSERT OR REPLACE INTO idempotency (key, fingerprint, created, result) VALUES (?, ?, ?, NULL)",
+                        (key, fingerprint, now),
+                    )
+                    state = ("claimed", None, None)
+                elif row[2] is None:
+                    state = ("pending", row[0], None)
+                else:
+                    state = ("done", row[0], json.loads(row[2]))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return state
+
+    def _complete(self, key: str, result: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE idempotency SET result = ? WHERE key = ?", (json.dumps(result, ensure_ascii=False), key)
+            )
+
+    def _release(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM idempotency WHERE key = ? AND result IS NULL", (key,))
+
+    def _remember(self, key: str, fingerprint: str, result: Dict[str, Any]):
+        self._memory[key] = (time.monotonic() + self.window, fingerprint, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.maxsize:
+            self._memory.popitem(last=False)
+
+    def _replay(self, fingerprint: str, stored: Optional[str], result: Dict[str, Any]) -> Dict[str, Any]:
+        if stored != fingerprint:
+            raise IdempotencyError(422, "Idempotency key was already used for a different request")
+        self.replayed += 1
+        return result
+
+    async def run(
+        self, key: str, fingerprint: str, compute: Callable[[], Awaitable[Dict[str, Any]]]
+    ) -> Tuple[Dict[str, Any], bool]:
+        """Result for ``key`` and whether it is a replay; ``compute`` runs at most once per key"""
+        entry = self._memory.get(key)
+        if entry is not None:
+            expires, stored, result = entry
+            if expires > time.monotonic():
+                self._memory.move_to_end(key)
+                return self._replay(fingerprint, stored, result), True
+            del self._memory[key]
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            stored, future = inflight
+            if stored != fingerprint:
+                raise IdempotencyError(422, "Idempotency key was already used for a different request")
+            result = await asyncio.shield(future)
+            return self._replay(fingerprint, stored, result), True
+
+        future = asyncio.get_running_loop().create_future()
+        # Waiters re-raise the original failure; nobody waiting is fine too
+        future.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._inflight[key] = (fingerprint, future)
+        claimed = False
+        try:
+            state, stored, result = await run_in_threadpool(self._claim, key, fingerprint)
+            if state == "pending":
+                self.conflicts += 1
+                raise IdempotencyError(409, "A request with this idempotency key is still being processed")
+            if state == "done":
+                result = self._replay(fingerprint, stored, result)
+                self._remember(key, fingerprint, result)
+                future.set_result(result)
+                return result, True
+
+            claimed = True
+            result = await compute()
+            await run_in_threadpool(self._complete, key, result)
+            self._remember(key, fingerprint, result)
+            future.set_result(result)
+            return result, False
+        except BaseException as e:
+            if claimed:
+                # The request did not happen; a retry may try again
+                await asyncio.shield(run_in_threadpool(self._release, key))
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self._memory),
+            "maxsize": self.maxsize,
+            "inflight": len(self._inflight),
+            "replayed": self.replayed,
+            "conflicts": self.conflicts,
+        }
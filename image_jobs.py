@@ -0,0 +1,214 @@
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Optional, Tuple
+
+from blob_store import BlobStore
+
+# Leading bytes of the image formats we accept, checked at upload time
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+]
+# Enough leading bytes to recognize every format above (and WebP)
+SNIFF_BYTES = 12
+
+# Derivative kinds: longest side in pixels and JPEG quality
+DERIVATIVES = {
+    "thumbnail": (320, 80),
+    "normalized": (2048, 85),
+}
+
+# Refuse to decode images larger than this (about a 12000x12000 picture)
+MAX_IMAGE_PIXELS = 150_000_000
+
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Image format from the first bytes of a file, or None if it is not one we accept"""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, image_format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_format
+    return None
+
+
+def render_derivatives(source: str, outputs: Dict[str, Tuple[str, int, int]]) -> Dict[str, int]:
+    """
+    Decode ``source`` once and write each output as a JPEG (runs in a worker process).
+
+    ``outputs`` maps a kind to (path, longest side, quality). Returns the size
+    of each file written.
+    """
+    from PIL import Image, ImageOps
+
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+    sizes = {}
+    with Image.open(source) as image:
+        # JPEGs can be decoded at a reduced scale, much faster than full size
+        largest = max(side for _, side, _ in outputs.values())
+        image.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            # Transparent areas become white rather than black
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        for kind, (path, side, quality) in sorted(outputs.items(), key=lambda item: -item[1][1]):
+            derivative = image.copy()
+            derivative.thumbnail((side, side), Image.LANCZOS)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp = f"{path}.{os.getpid()}.tmp"
+            derivative.save(temp, "JPEG", quality=quality, optimize=True, progressive=True)
+            os.replace(temp, path)
+            sizes[kind] = os.path.getsize(path)
+    return sizes
+
+
+class ImageJob:
+    def __init__(self, digest: str):
+        self.digest = digest
+        self.created = time.time()
+        self.finished: Optional[float] = None
+        self.future: Optional[Future] = None
+        self.sizes: Dict[str, int] = {}
+        self.error: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        if self.future is None:
+            return "done"
+        if self.future.done():
+            return "failed" if self.future.cancelled() or self.future.exception() else "done"
+        return "running" if self.future.running() else "queued"
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "id": self.digest,
+            "state": self.state,
+            "created": self.created,
+            "finished": self.finished,
+            "derivatives": self.sizes,
+            "error": self.error,
+        }
+
+
+class ImageJobQueue:
+    """
+    Thumbnails and normalized re-encodes of uploaded images, made off the
+    request path on a process pool.
+
+    Derivatives are cached on disk as ``derivatives/<kind>/<aa>/<sha256>.jpg``
+    next to the blobs; since blobs never change, a derivative that exists is
+    never made again. One job per source image makes every kind; its status
+    stays queryable until ``max_jobs`` newer jobs have finished.
+    """
+
+    def __init__(self, store: BlobStore, workers: int = 0, max_jobs: int = 10000):
+        self.store = store
+        self.directory = os.path.join(store.directory, "derivatives")
+        self.workers = workers or os.cpu_count() or 1
+        self.max_jobs = max_jobs
+        self.jobs: "OrderedDict[str, ImageJob]" = OrderedDict()
+        self.completed = 0
+        self.failed = 0
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def start(self):
+        # Fresh interpreters rather than forks of the server process and its threads
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def derivative_path(self, digest: str, kind: str) -> str:
+        return os.path.join(self.directory, kind, digest[:2], digest + ".jpg")
+
+    def _missing(self, digest: str) -> Dict[str, Tuple[str, int, int]]:
+        outputs = {}
+        for kind, (side, quality) in DERIVATIVES.items():
+            path = self.derivative_path(digest, kind)
+            if not os.path.exists(path):
+                outputs[kind] = (path, side, quality)
+        return outputs
+
+    def submit(self, digest: str) -> ImageJob:
+        """Queue derivatives of a stored image, unless they exist or are being made"""
+        job = self.jobs.get(digest)
+        if job is not None and job.state in ("queued", "running"):
+            return job
+        job = ImageJob(digest)
+        outputs = self._missing(digest)
+        if not outputs:
+            job.finished = job.created
+            job.sizes = self._cached_sizes(digest)
+        else:
+            job.future = self._pool.submit(render_derivatives, self.store.blob_path(digest), outputs)
+            job.future.add_done_callback(lambda future: self._finish(job, future))
+        self.jobs[digest] = job
+        self.jobs.move_to_end(digest)
+        self._trim()
+        return job
+
+    def _finish(self, job: ImageJob, future: Future):
+        # Runs on the pool's management thread; only plain attribute updates here
+        job.finished = time.time()
+        if future.cancelled():
+            job.error = "cancelled"
+        elif future.exception() is not None:
+            job.error = str(future.exception()) or type(future.exception()).__name__
+            self.failed += 1
+        else:
+            job.sizes = future.result()
+            self.completed += 1
+
+    def _trim(self):
+        while len(self.jobs) > self.max_jobs:
+            digest, job = next(iter(self.jobs.items()))
+            if job.state in ("queued", "running"):
+                break
+            del self.jobs[digest]
+
+    def status(self, digest: str) -> Optional[Dict[str, Any]]:
+        job = self.jobs.get(digest)
+        if job is not None:
+            return job.status()
+        if not self._missing(digest):
+            # Made before a restart; the cache on disk is the record
+            return {"id": digest, "state": "done", "derivatives": self._cached_sizes(digest)}
+        return None
+
+    def _cached_sizes(self, digest: str) -> Dict[str, int]:
+        return {kind: os.path.getsize(self.derivative_path(digest, kind)) for kind in DERIVATIVES}
+
+    def prune(self) -> int:
+        """Remove derivatives whose source blob was garbage-collected"""
+        removed = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                digest = name.split(".")[0]
+                if name.endswith(".jpg") and not os.path.exists(self.store.blob_path(digest)):
+                    os.remove(os.path.join(root, name))
+                    removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        states: Dict[str, int] = {}
+        for job in self.jobs.values():
+            states[job.state] = states.get(job.state, 0) + 1
+        return {
+            "workers": self.workers,
+            "jobs": states,
+            "completed": self.completed,
+            "failed": self.failed,
+        }
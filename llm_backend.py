@@ -0,0 +1,252 @@
+import asyncio
+import json
+import time
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from fastapi.concurrency import run_in_threadpool
+
+from settings import Settings
+from text_rules import RuleEngine
+
+
+class BackendError(Exception):
+    """The model backend failed, timed out or is not accepting calls"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling a failing backend for a while.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``reset_timeout`` seconds. Then it lets one trial call
+    through (half-open): success closes it again, failure re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_started: Optional[float] = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open":
+            # A trial that never reported back (e.g. was cancelled) is given up on
+            now = time.monotonic()
+            if self._trial_started is None or now - self._trial_started >= self.reset_timeout:
+                self._trial_started = now
+                return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None
+
+    def failure(self):
+        self.failures += 1
+        self._trial_started = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class ImproveBackend:
+    """Interface of text improvement backends"""
+
+    name = "base"
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.fallbacks = 0
+
+    @property
+    def version(self) -> str:
+        """Identifies what produces the results, for cache keys"""
+        return self.name
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    async def improve(self, text: str) -> str:
+        raise NotImplementedError
+
+    async def stream(self, text: str) -> AsyncIterator[str]:
+        """Yield the improved text in pieces as they are produced"""
+        # Backends that cannot stream produce everything at once
+        yield await self.improve(text)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.name,
+            "calls": self.calls,
+            "failures": self.failures,
+            "fallbacks": self.fallbacks,
+        }
+
+
+class RuleBasedBackend(ImproveBackend):
+    """The local rule engine, run in the threadpool"""
+
+    name = "rules"
+
+    def __init__(self, rules: RuleEngine):
+        super().__init__()
+        self.rules = rules
+
+    @property
+    def version(self) -> str:
+        return f"rules:{self.rules.version}"
+
+    async def improve(self, text: str) -> str:
+        self.calls += 1
+        return await run_in_threadpool(self.rules.improve, text)
+
+
+class HTTPModelBackend(ImproveBackend):
+    """
+    Remote model behind ``POST {url}/improve`` ({"text"} -> {"improved_text"})
+    and ``POST {url}/improve/stream`` (NDJSON lines of {"delta"}).
+
+    Calls share one pooled HTTP client, at most ``max_concurrency`` run at a
+    time, each one (including the wait for a slot) is bounded by ``timeout``,
+    and a circuit breaker fails fast while the model keeps failing.
+    """
+
+    name = "http"
+
+    def __init__(
+        self,
+        url: str,
+        max_concurrency: int = 8,
+        timeout: float = 10,
+        pool_size: int = 16,
+        breaker: Optional[CircuitBreaker] = None,
+    ):
+        super().__init__()
+        self.url = url.rstrip("/")
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.timeouts = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def version(self) -> str:
+        return f"http:{self.url}"
+
+    async def start(self):
+        self._client = httpx.AsyncClient(
+            base_url=self.url,
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size),
+        )
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _call(self, text: str) -> str:
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                response = await self._client.post("/improve", json={"text": text})
+                response.raise_for_status()
+                return response.json()["improved_text"]
+            finally:
+                self.in_flight -= 1
+
+    def _admit(self):
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise BackendError("circuit breaker is open")
+        self.calls += 1
+
+    def _failed(self, timed_out: bool = False):
+        self.failures += 1
+        if timed_out:
+            self.timeouts += 1
+        self.breaker.failure()
+
+    async def improve(self, text: str) -> str:
+        self._admit()
+        try:
+            improved = await asyncio.wait_for(self._call(text), self.timeout)
+        except asyncio.TimeoutError:
+            self._failed(timed_out=True)
+            raise BackendError(f"model call timed out after {self.timeout}s")
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            self._failed(timed_out=isinstance(e, httpx.TimeoutException))
+            raise BackendError(f"model call failed: {str(e)}")
+        self.breaker.success()
+        return improved
+
+    async def stream(self, text: str) -> AsyncIterator[str]:
+        # ``timeout`` bounds the wait for a slot and every read from the model;
+        # if the consumer goes away, leaving the block closes the model connection
+        self._admit()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self._failed(timed_out=True)
+            raise BackendError(f"no model slot free after {self.timeout}s")
+        self.in_flight += 1
+        try:
+            async with self._client.stream("POST", "/improve/stream", json={"text": text}) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if line:
+                        yield json.loads(line)["delta"]
+        except (httpx.HTTPError, KeyError, ValueError) as e:
+            self._failed(timed_out=isinstance(e, httpx.TimeoutException))
+            raise BackendError(f"model stream failed: {str(e)}")
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+        self.breaker.success()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **super().stats(),
+            "url": self.url,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "breaker": self.breaker.state,
+        }
+
+
+def create_backend(settings: Settings, rules: RuleEngine) -> ImproveBackend:
+    if settings.llm_backend == RuleBasedBackend.name:
+        return RuleBasedBackend(rules)
+    if settings.llm_backend == HTTPModelBackend.name:
+        return HTTPModelBackend(
+            settings.llm_url,
+            max_concurrency=settings.llm_max_concurrency,
+            timeout=settings.llm_timeout,
+            pool_size=settings.llm_pool_size,
+            breaker=CircuitBreaker(settings.llm_breaker_failures, settings.llm_breaker_reset),
+        )
+    raise ValueError(f"Unknown LLM backend: {settings.llm_backend}")
@@ -0,0 +1,187 @@
+import asyncio
+import cProfile
+import hmac
+import io
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import tracemalloc
+import uuid
+from typing import Any, Dict, List, Optional, Tuple
+
+# "cpu": cProfile, "memory": tracemalloc, "all": both
+PROFILE_MODES = ("off", "cpu", "memory", "all")
+
+# Requests that may be profiled (submit_form, improve_text, get_logs)
+PROFILED_PATHS = frozenset({"/api/submit-form", "/api/improve-text", "/logs"})
+
+# An admin sends this header with the admin token to have a request profiled
+PROFILE_HEADER = b"x-profile"
+
+# Frames kept per traced allocation
+TRACEMALLOC_FRAMES = 10
+# Lines in the text summary of each profile
+SUMMARY_LINES = 40
+
+PROFILE_FILE = re.compile(r"^\d{8}T\d{6}-[a-z0-9-]+-[0-9a-f]{8}\.(prof|tracemalloc|txt)$")
+
+
+class RequestProfiler:
+    """
+    Captures a cProfile and/or a tracemalloc snapshot of selected requests.
+
+    A request is profiled when it carries the ``X-Profile`` header with the
+    admin token, or by chance at ``sample_rate``. Only one request is
+    profiled at a time, since both profilers are process-wide: the CPU
+    profile covers the event loop thread for the duration of the request,
+    so it includes whatever else ran on the loop meanwhile, and not work
+    the request handed to the threadpool.
+
+    Each profile is saved in ``directory`` as ``<name>.prof`` (load with
+    pstats), ``<name>.tracemalloc`` (``tracemalloc.Snapshot.load``) and a
+    ``<name>.txt`` summary; only the newest ``keep`` profiles are kept.
+    """
+
+    def __init__(self, directory: str, mode: str, sample_rate: float = 0.0, keep: int = 100, token: str = ""):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode: {mode}")
+        self.directory = directory
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.keep = keep
+        self.token = token.encode("utf-8")
+        self.profiled = 0
+        self._active = False
+        self._lock = threading.Lock()
+
+    def wanted(self, scope) -> bool:
+        if self._active or scope["path"] not in PROFILED_PATHS:
+            return False
+        if self.token:
+            for name, value in scope["headers"]:
+                if name == PROFILE_HEADER:
+                    return hmac.compare_digest(value, self.token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def new_name(self, path: str) -> str:
+        route = re.sub(r"[^a-z0-9]+", "-", path.lower()).strip("-")
+        return f"{time.strftime('%Y%m%dT%H%M%S', time.gmtime())}-{route}-{uuid.uuid4().hex[:8]}"
+
+    def begin(self) -> Tuple[Optional[cProfile.Profile], bool]:
+        self._active = True
+        tracing = False
+        # Leave tracemalloc alone if someone else (e.g. a benchmark) is using it
+        if self.mode in ("memory", "all") and not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+            tracing = True
+        profile = None
+        if self.mode in ("cpu", "all"):
+            profile = cProfile.Profile()
+            profile.enable()
+        return profile, tracing
+
+    def end(self, session: Tuple[Optional[cProfile.Profile], bool]) -> Tuple[Optional[cProfile.Profile], Optional[tracemalloc.Snapshot]]:
+        profile, tracing = session
+        if profile is not None:
+            profile.disable()
+        snapshot = None
+        if tracing:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        self._active = False
+        self.profiled += 1
+        return profile, snapshot
+
+    def save(self, name: str, elapsed: float, profile: Optional[cProfile.Profile], snapshot: Optional[tracemalloc.Snapshot]):
+        """Write the profile files and drop the oldest profiles (blocking)"""
+        os.makedirs(self.directory, exist_ok=True)
+        base = os.path.join(self.directory, name)
+        summary = io.StringIO()
+        summary.write(f"{name}: {elapsed * 1000:.1f} ms\n")
+        if profile is not None:
+            profile.dump_stats(base + ".prof")
+            summary.write("\nCPU, by cumulative time:\n")
+            pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+        if snapshot is not None:
+            snapshot.dump(base + ".tracemalloc")
+            summary.write("\nMemory still allocated at the end of the request, by line:\n")
+            for stat in snapshot.statistics("lineno")[:SUMMARY_LINES]:
+                summary.write(f"{stat}\n")
+        with open(base + ".txt", "w", encoding="utf-8") as f:
+            f.write(summary.getvalue())
+        with self._lock:
+            self._rotate()
+
+    def _rotate(self):
+        saved: Dict[str, float] = {}
+        for file in list_profiles(self.directory):
+            name = file["name"].rsplit(".", 1)[0]
+            saved[name] = max(saved.get(name, 0.0), file["modified"])
+        for old in sorted(saved, key=saved.get, reverse=True)[self.keep:]:
+            for suffix in (".prof", ".tracemalloc", ".txt"):
+                try:
+                    os.remove(os.path.join(self.directory, old + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def stats(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "sample_rate": self.sample_rate, "profiled": self.profiled}
+
+
+def list_profiles(directory: str) -> List[Dict[str, Any]]:
+    """Saved profile files, newest first"""
+    if not os.path.isdir(directory):
+        return []
+    files = []
+    for name in os.listdir(directory):
+        if PROFILE_FILE.match(name):
+            stat = os.stat(os.path.join(directory, name))
+            files.append({"name": name, "size": stat.st_size, "modified": stat.st_mtime})
+    return sorted(files, key=lambda file: (file["modified"], file["name"]), reverse=True)
+
+
+def profile_path(directory: str, name: str) -> Optional[str]:
+    """Path of a saved profile file, or None if ``name`` is not one"""
+    if not PROFILE_FILE.match(name):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the requests ``profiler`` picks. Only added
+    to the app when profiling is enabled, so it costs nothing otherwise.
+    The profile's name is returned in the ``X-Profile-Id`` response header.
+    """
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = self.profiler.new_name(scope["path"])
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"x-profile-id", name.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        session = self.profiler.begin()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            profile, snapshot = self.profiler.end(session)
+            elapsed = time.perf_counter() - started
+            try:
+                await asyncio.to_thread(self.profiler.save, name, elapsed, profile, snapshot)
+            except Exception as e:
+                print(f"Error saving request profile: {str(e)}")
@@ -0,0 +1,58 @@
+import fcntl
+import os
+import threading
+import time
+from typing import IO, Tuple
+
+MAX_WORKER_SLOTS = 1000
+MAX_SEQUENCE = 999999
+
+
+def claim_worker_slot(directory: str) -> Tuple[int, IO]:
+    """
+    Claim the lowest free worker slot by locking ``worker-<n>.lock``.
+
+    The lock is held for as long as the returned file stays open (normally the
+    life of the process), so concurrent uvicorn workers always get distinct
+    slots and a restarted worker reuses a freed one.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for slot in range(MAX_WORKER_SLOTS):
+        f = open(os.path.join(directory, f"worker-{slot:03d}.lock"), "a")
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            f.close()
+            continue
+        return slot, f
+    raise RuntimeError(f"No free worker slot in {directory}")
+
+
+class RecordIdGenerator:
+    """
+    Unique, monotonic record ids ``<unix ms>-<worker>-<sequence>``.
+
+    Ids from one worker never repeat or go backwards, even if the clock does,
+    and ids from different workers differ in the worker part. Their string
+    order follows creation time, which is what the merged log view sorts on.
+    """
+
+    def __init__(self, worker: int):
+        self.worker = worker
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next(self) -> str:
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            else:
+                self._sequence += 1
+                if self._sequence > MAX_SEQUENCE:
+                    # Borrow the next millisecond rather than repeat an id
+                    self._last_ms += 1
+                    self._sequence = 0
+            return f"{self._last_ms:013d}-{self.worker:03d}-{self._sequence:06d}"
@@ -0,0 +1,78 @@
+import mmap
+import os
+import struct
+import threading
+from typing import Iterable, Optional
+
+from submission_log import Location
+
+# Segment number and byte offset of one record
+ENTRY = struct.Struct("<IQ")
+
+
+class RecordOffsets:
+    """
+    Location of every record of a segment log by record number, as a file of
+    fixed-width entries: record ``n`` is described at byte ``n * ENTRY.size``.
+
+    Lookups go through a memory map of the file, remapped when it has grown,
+    so finding any record is one slice of the map. Only the log's owner
+    (``writable``) appends; readers see entries as the owner writes them.
+    """
+
+    def __init__(self, path: str, writable: bool = True):
+        self.path = path
+        self.writable = writable
+        self._file = None
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    def open(self, truncate: bool = False):
+        if not self.writable:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._file = open(self.path, "wb" if truncate else "ab")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            if self._map is not None:
+                self._map.close()
+                self._map = None
+
+    def count(self) -> int:
+        try:
+            return os.path.getsize(self.path) // ENTRY.size
+        except FileNotFoundError:
+            return 0
+
+    def append(self, locations: Iterable[Location]):
+        data = b"".join(ENTRY.pack(segment, offset) for segment, offset in locations)
+        if self._file is not None and data:
+            self._file.write(data)
+            self._file.flush()
+
+    def get(self, number: int) -> Optional[Location]:
+        """Location of record ``number`` (from 0), or None if the file does not have it yet"""
+        start = number * ENTRY.size
+        with self._lock:
+            if self._map is None or start + ENTRY.size > len(self._map):
+                self._remap()
+            if self._map is None or start + ENTRY.size > len(self._map):
+                return None
+            return ENTRY.unpack_from(self._map, start)
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        try:
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                length = size - size % ENTRY.size
+                if length:
+                    self._map = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            pass
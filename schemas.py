@@ -0,0 +1,92 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import Annotated, Any, Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator
+
+# Sections per submission; the batch improvement endpoint has the same bound
+MAX_EVENTS = 50
+# Images plus text files a section can upload
+MAX_ATTACHMENTS = 10
+
+
+class Attachment(BaseModel):
+    """A file uploaded through /api/upload, referenced by content hash"""
+
+    model_config = ConfigDict(extra="ignore")
+
+    field: str = Field(default="", max_length=32)
+    filename: str = Field(max_length=255)
+    content_type: str = Field(default="", max_length=255)
+    size: int = Field(ge=0)
+    sha256: str = Field(pattern=r"^[0-9a-f]{64}$")
+    image_format: Optional[str] = Field(default=None, max_length=16)
+
+
+class EventSection(BaseModel):
+    """One event of the form"""
+
+    model_config = ConfigDict(extra="forbid", str_strip_whitespace=True)
+
+    title: str = Field(min_length=1, max_length=300)
+    link: str = Field(default="", max_length=2048)
+    description: str = Field(default="", max_length=10000)
+    source: str = Field(min_length=1, max_length=500)
+    children_terms: str = Field(default="", max_length=2000)
+    message: str = Field(default="", max_length=5000)
+    attachments: List[Attachment] = Field(default_factory=list, max_length=MAX_ATTACHMENTS)
+
+
+class TelegramUser(BaseModel):
+    model_config = ConfigDict(extra="ignore", str_max_length=256)
+
+    # Telegram user ids are numbers; the page sends "" when there is none
+    id: Union[int, Annotated[str, Field(pattern=r"^[0-9]{0,20}$")], None] = None
+    first_name: str = ""
+    last_name: str = ""
+    username: str = ""
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+class FormSubmission(BaseModel):
+    """
+    A form submission as received and as stored.
+
+    Parsed straight from the request body with ``model_validate_json`` and
+    written with ``model_dump_json``, so both directions run in pydantic-core.
+    """
+
+    model_config = ConfigDict(extra="forbid")
+
+    user: Optional[TelegramUser] = None
+    submission_time: datetime = Field(default_factory=utc_now)
+    events: List[EventSection] = Field(min_length=1, max_length=MAX_EVENTS)
+    # Assigned by the storage when the submission is accepted
+    record_id: Optional[str] = Field(default=None, max_length=64)
+
+    @field_validator("submission_time")
+    @classmethod
+    def assume_utc(cls, value: datetime) -> datetime:
+        # Like parse_time: a time without an offset is UTC
+        return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+    def attachment_hashes(self) -> List[str]:
+        return [attachment.sha256 for event in self.events for attachment in event.attachments]
+
+    def fingerprint(self) -> str:
+        """Identifies the content of the submission; the same form sent again has the same one"""
+        data = self.model_dump_json(exclude={"submission_time", "record_id"})
+        return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+    def index_fields(self) -> Dict[str, Any]:
+        """The fields the storage indexes on, in their stored form"""
+        return {
+            "user": {"id": self.user.id} if self.user else {},
+            "submission_time": self.submission_time.isoformat(),
+        }
+
+    def encode(self, indent: Optional[int] = None) -> bytes:
+        return self.model_dump_json(indent=indent).encode("utf-8")
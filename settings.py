@@ -0,0 +1,133 @@
+import os
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+@dataclass
+class Settings:
+    """Runtime configuration, read from the environment (and a .env file)"""
+    log_dir: str = "logs"
+    # Submission log segments are rotated by size or age, whichever comes first
+    segment_max_bytes: int = 64 * 1024 * 1024
+    segment_max_age: int = 24 * 60 * 60
+    # Write-behind queue: "enqueue" acks once the writer has taken the submission, "fsync" once on disk
+    write_durability: str = "fsync"
+    write_queue_size: int = 1000
+    write_batch_size: int = 256
+    # Submission storage backend: "json" (files + segment log) or "sqlite"
+    storage_backend: str = "json"
+    sqlite_path: str = "logs/submissions.db"
+    # Rule table for text improvement, reloaded when the file changes
+    text_rules_file: str = "text_rules.json"
+    # Cache of improved texts
+    improve_cache_size: int = 1024
+    improve_cache_ttl: int = 60 * 60
+    # Text improvement backend: "rules" (local) or "http" (model server at llm_url);
+    # the rule engine is the fallback whenever the model fails
+    llm_backend: str = "rules"
+    llm_url: str = "http://127.0.0.1:8081"
+    llm_max_concurrency: int = 8
+    llm_timeout: float = 10.0
+    llm_pool_size: int = 16
+    llm_breaker_failures: int = 5
+    llm_breaker_reset: float = 30.0
+    # Event images and text files uploaded with the form
+    upload_dir: str = "uploads"
+    upload_max_file_size: int = 9 * 1024 * 1024
+    upload_max_files: int = 5
+    # Past days of the submission log are archived (gzip) every interval; 0 disables
+    compaction_interval: float = 3600.0
+    # Unreferenced attachments are removed after the grace period, checked every interval
+    blob_gc_grace: float = 86400.0
+    blob_gc_interval: float = 3600.0
+    # Processes making image thumbnails and re-encodes (0: one per CPU)
+    image_workers: int = 0
+    # Memory for compressed variants of recently served responses
+    response_cache_bytes: int = 32 * 1024 * 1024
+    # How long repeated submissions (same idempotency key) are answered from the table
+    idempotency_window: float = 86400.0
+    idempotency_cache_size: int = 10000
+    # Requests per minute and burst allowed to each user (or client IP), by route; 0 disables
+    submit_rate: float = 6.0
+    submit_burst: int = 5
+    improve_rate: float = 60.0
+    improve_burst: int = 30
+    upload_rate: float = 30.0
+    upload_burst: int = 10
+    rate_limit_clients: int = 100000
+    # Each client address also gets this many times a user's rate and burst, whatever
+    # user ids it sends (which clients can make up); 0 disables
+    address_rate_factor: float = 10.0
+    # Beyond these the server answers 429 to everyone rather than slowing down for everyone
+    shed_write_backlog: int = 800
+    shed_improve_in_flight: int = 64
+    # Request profiling: "off", "cpu" (cProfile), "memory" (tracemalloc) or "all";
+    # requests are profiled on an admin's X-Profile header or at the sample rate
+    profile_mode: str = "off"
+    profile_sample_rate: float = 0.0
+    profile_keep: int = 100
+    # Token for the admin endpoints and headers; admin access is off while it is empty
+    admin_token: str = ""
+    # Where the page's CSS and JS are built at startup
+    static_dir: str = "static"
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        load_dotenv()
+        log_dir = os.getenv("LOG_DIR", cls.log_dir)
+        return cls(
+            log_dir=log_dir,
+            segment_max_bytes=_env_int("SEGMENT_MAX_BYTES", cls.segment_max_bytes),
+            segment_max_age=_env_int("SEGMENT_MAX_AGE", cls.segment_max_age),
+            write_durability=os.getenv("WRITE_DURABILITY", cls.write_durability),
+            write_queue_size=_env_int("WRITE_QUEUE_SIZE", cls.write_queue_size),
+            write_batch_size=_env_int("WRITE_BATCH_SIZE", cls.write_batch_size),
+            storage_backend=os.getenv("STORAGE_BACKEND", cls.storage_backend),
+            sqlite_path=os.getenv("SQLITE_PATH", os.path.join(log_dir, "submissions.db")),
+            text_rules_file=os.getenv("TEXT_RULES_FILE", cls.text_rules_file),
+            improve_cache_size=_env_int("IMPROVE_CACHE_SIZE", cls.improve_cache_size),
+            improve_cache_ttl=_env_int("IMPROVE_CACHE_TTL", cls.improve_cache_ttl),
+            llm_backend=os.getenv("LLM_BACKEND", cls.llm_backend),
+            llm_url=os.getenv("LLM_URL", cls.llm_url),
+            llm_max_concurrency=_env_int("LLM_MAX_CONCURRENCY", cls.llm_max_concurrency),
+            llm_timeout=_env_float("LLM_TIMEOUT", cls.llm_timeout),
+            llm_pool_size=_env_int("LLM_POOL_SIZE", cls.llm_pool_size),
+            llm_breaker_failures=_env_int("LLM_BREAKER_FAILURES", cls.llm_breaker_failures),
+            llm_breaker_reset=_env_float("LLM_BREAKER_RESET", cls.llm_breaker_reset),
+            upload_dir=os.getenv("UPLOAD_DIR", cls.upload_dir),
+            upload_max_file_size=_env_int("UPLOAD_MAX_FILE_SIZE", cls.upload_max_file_size),
+            upload_max_files=_env_int("UPLOAD_MAX_FILES", cls.upload_max_files),
+            compaction_interval=_env_float("COMPACTION_INTERVAL", cls.compaction_interval),
+            blob_gc_grace=_env_float("BLOB_GC_GRACE", cls.blob_gc_grace),
+            blob_gc_interval=_env_float("BLOB_GC_INTERVAL", cls.blob_gc_interval),
+            image_workers=_env_int("IMAGE_WORKERS", cls.image_workers),
+            response_cache_bytes=_env_int("RESPONSE_CACHE_BYTES", cls.response_cache_bytes),
+            idempotency_window=_env_float("IDEMPOTENCY_WINDOW", cls.idempotency_window),
+            idempotency_cache_size=_env_int("IDEMPOTENCY_CACHE_SIZE", cls.idempotency_cache_size),
+            submit_rate=_env_float("SUBMIT_RATE", cls.submit_rate),
+            submit_burst=_env_int("SUBMIT_BURST", cls.submit_burst),
+            improve_rate=_env_float("IMPROVE_RATE", cls.improve_rate),
+            improve_burst=_env_int("IMPROVE_BURST", cls.improve_burst),
+            upload_rate=_env_float("UPLOAD_RATE", cls.upload_rate),
+            upload_burst=_env_int("UPLOAD_BURST", cls.upload_burst),
+            rate_limit_clients=_env_int("RATE_LIMIT_CLIENTS", cls.rate_limit_clients),
+            address_rate_factor=_env_float("ADDRESS_RATE_FACTOR", cls.address_rate_factor),
+            shed_write_backlog=_env_int("SHED_WRITE_BACKLOG", cls.shed_write_backlog),
+            shed_improve_in_flight=_env_int("SHED_IMPROVE_IN_FLIGHT", cls.shed_improve_in_flight),
+            profile_mode=os.getenv("PROFILE_MODE", cls.profile_mode),
+            profile_sample_rate=_env_float("PROFILE_SAMPLE_RATE", cls.profile_sample_rate),
+            profile_keep=_env_int("PROFILE_KEEP", cls.profile_keep),
+            admin_token=os.getenv("ADMIN_TOKEN", cls.admin_token),
+            static_dir=os.getenv("STATIC_DIR", cls.static_dir),
+        )
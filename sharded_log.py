@@ -0,0 +1,189 @@
+import heapq
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from submission_index import SubmissionIndex
+from submission_log import Location, SegmentLog
+
+SHARD_PREFIX = "shard-"
+INDEX_FILE = "index.ndjson"
+OFFSETS_FILE = "offsets.bin"
+
+
+class Shard:
+    """One worker's segment log and its user/day index"""
+
+    def __init__(self, name: str, directory: str, writable: bool, max_bytes: int, max_age: int):
+        self.name = name
+        self.log = SegmentLog(directory, max_bytes=max_bytes, max_age=max_age)
+        self.index = SubmissionIndex(
+            self.log,
+            os.path.join(directory, INDEX_FILE),
+            writable=writable,
+            offsets_path=os.path.join(directory, OFFSETS_FILE),
+        )
+
+
+class ShardedLog:
+    """
+    Submission log split into one shard per worker process.
+
+    Each worker appends only to its own ``shard-<worker>`` directory, so
+    workers never share a file and need no global lock. Reads merge every
+    shard in record id order; shards owned by other workers are followed
+    through read-only indexes that pick up their new records on each read.
+    """
+
+    def __init__(self, directory: str, worker: int, max_bytes: int, max_age: int):
+        self.directory = directory
+        self.worker = worker
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.own = self._make_shard(f"{SHARD_PREFIX}{worker:03d}", writable=True)
+        self._foreign: Dict[str, Shard] = {}
+        self._lock = threading.Lock()
+
+    def _make_shard(self, name: str, writable: bool) -> Shard:
+        return Shard(name, os.path.join(self.directory, name), writable, self.max_bytes, self.max_age)
+
+    def open(self, legacy_file: Optional[str] = None):
+        os.makedirs(self.own.log.directory, exist_ok=True)
+        if self.worker == 0:
+            # Worker 0 owns one-time migrations, so they never run twice
+            self._adopt_unsharded()
+            if legacy_file:
+                imported = self.own.log.import_legacy(legacy_file)
+                if imported:
+                    print(f"Imported {imported} submissions from {legacy_file}")
+        # Rebuilds the index if it is missing or stale
+        self.own.index.load()
+
+    def _adopt_unsharded(self):
+        """Move segments written before the log was sharded into this worker's shard"""
+        unsharded = SegmentLog(self.directory)
+        segments = unsharded.segments()
+        if not segments or self.own.log.segments():
+            return
+        for number, created in segments:
+            os.replace(unsharded.segment_path(number, created), self.own.log.segment_path(number, created))
+        for name in (INDEX_FILE, OFFSETS_FILE):
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+    def close(self):
+        self.own.index.close()
+        self.own.log.close()
+
+    def commit(self, lines: List[bytes], records: List[Dict[str, Any]]) -> List[Location]:
+        """
+        Append encoded records to this worker's shard with one write and one
+        fsync, then index them by their ``records`` (the indexed fields suffice)
+        """
+        locations = self.own.log.append_lines(lines)
+        self.own.log.sync()
+        self.own.index.add_many(locations, records)
+        return locations
+
+    def shard_names(self) -> List[str]:
+        names = {self.own.name}
+        if os.path.isdir(self.directory):
+            names.update(name for name in os.listdir(self.directory) if name.startswith(SHARD_PREFIX))
+        return sorted(names)
+
+    def shard(self, name: str) -> Shard:
+        if name == self.own.name:
+            return self.own
+        with self._lock:
+            shard = self._foreign.get(name)
+            if shard is None:
+                shard = self._foreign[name] = self._make_shard(name, writable=False)
+                shard.index.load()
+                return shard
+        shard.index.refresh()
+        return shard
+
+    def usage(self) -> Tuple[int, int]:
+        """Bytes and records in all shards"""
+        size = records = 0
+        for name in self.shard_names():
+            shard = self.shard(name)
+            size += shard.log.size()
+            records += shard.index.count
+        return size, records
+
+    def seek(self, position: int) -> Dict[str, Location]:
+        """
+        The ``after`` positions at which iter_records starts with record
+        ``position`` (from 0) of the merged order.
+
+        Each round probes the record ``remaining // shards`` ahead in every
+        shard and skips that many in the shard whose probe sorts first: they
+        all precede the target, since every other shard has fewer records
+        before that probe. Probes go through the offsets index, so this reads
+        O(shards * log(position)) records rather than ``position`` of them.
+        """
+        shards = [self.shard(name) for name in self.shard_names()]
+        taken = {shard.name: 0 for shard in shards}
+        probed: Dict[Tuple[str, int], Tuple[str, str, int]] = {}
+
+        def key(shard: Shard, number: int) -> Tuple[str, str, int]:
+            if (shard.name, number) not in probed:
+                location = shard.index.location(number)
+                record = {}
+                for _, record in shard.log.read_at([location] if location is not None else []):
+                    break
+                # The same order as _keyed
+                probed[shard.name, number] = (record.get("record_id") or "", shard.name, number)
+            return probed[shard.name, number]
+
+        remaining = position
+        while remaining > 0:
+            candidates = [shard for shard in shards if taken[shard.name] < shard.index.count]
+            if not candidates:
+                break
+            step = max(1, remaining // len(candidates))
+            best = min(candidates, key=lambda shard: key(shard, min(taken[shard.name] + step, shard.index.count) - 1))
+            skipped = min(step, best.index.count - taken[best.name])
+            taken[best.name] += skipped
+            remaining -= skipped
+        return {shard.name: shard.index.location(taken[shard.name] - 1) for shard in shards if taken[shard.name]}
+
+    def iter_records(
+        self,
+        after: Optional[Dict[str, Location]] = None,
+        user_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[Tuple[str, Location, Dict[str, Any]]]:
+        """
+        Yield (shard name, location, record) across all shards in record id order.
+
+        ``after`` maps shard names to the last location already consumed in
+        that shard. ``user_id`` or ``since``/``until`` narrow each shard to the
+        candidates found in its index; callers still check each record.
+        """
+        after = after or {}
+        streams = []
+        for name in self.shard_names():
+            shard = self.shard(name)
+            start = after.get(name)
+            if user_id is not None:
+                records = shard.log.read_at(shard.index.lookup_user(user_id, after=start))
+            elif since is not None or until is not None:
+                records = shard.log.read_at(shard.index.lookup_days(since, until, after=start))
+            else:
+                records = shard.log.iter_records(start)
+            streams.append(self._keyed(name, start, records))
+        for _, name, location, record in heapq.merge(*streams):
+            yield name, location, record
+
+    @staticmethod
+    def _keyed(name: str, start: Optional[Location], records: Iterable[Tuple[Location, Dict[str, Any]]]):
+        for location, record in records:
+            if location != start:
+                # Records from before record ids existed sort first
+                yield record.get("record_id") or "", name, location, record
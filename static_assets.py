@@ -0,0 +1,128 @@
+import hashlib
+import mimetypes
+import os
+import re
+import stat
+from typing import Dict, Optional
+
+from fastapi.staticfiles import StaticFiles
+from starlette.staticfiles import NotModifiedResponse
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.types import Scope
+
+from compression import ENCODINGS, accepted_encodings, compress
+
+# Built names carry a content hash: styles.0123456789ab.css
+FINGERPRINTED = re.compile(r"^.+\.[0-9a-f]{12}\.[a-z0-9]+$")
+
+# Fingerprinted files never change; cache them for a year
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Anything else may change on the next deploy
+REVALIDATE = "no-cache"
+
+
+def write_if_changed(path: str, data: bytes) -> bool:
+    try:
+        with open(path, "rb") as f:
+            if f.read() == data:
+                return False
+    except FileNotFoundError:
+        pass
+    # Every worker builds the assets at startup; each writes its own temp file
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, path)
+    return True
+
+
+def build_assets(directory: str, sources: Dict[str, str]) -> Dict[str, str]:
+    """
+    Write each source as ``name.<hash>.ext`` plus gzip/brotli variants.
+
+    Returns the manifest of source name -> fingerprinted name. Outputs that
+    already exist are left alone, so rebuilding unchanged sources writes
+    nothing. Older builds stay in place for pages that still reference them.
+    """
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for name, text in sources.items():
+        data = text.encode("utf-8")
+        stem, extension = os.path.splitext(name)
+        built = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{extension}"
+        path = os.path.join(directory, built)
+        if not os.path.exists(path):
+            for encoding, suffix in ENCODINGS:
+                compressed = compress(data, encoding)
+                # A variant that is not smaller is not worth sending
+                if len(compressed) < len(data):
+                    write_if_changed(path + suffix, compressed)
+            # Written last: its presence means the build of this file is complete
+            write_if_changed(path, data)
+        # The plain name is kept up to date for anything linking to it directly
+        write_if_changed(os.path.join(directory, name), data)
+        manifest[name] = built
+    return manifest
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles that serves precompressed ``.br``/``.gz`` variants when the
+    client accepts them, and caches fingerprinted files forever.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Full path -> variants present on disk; built files never change
+        self._variants: Dict[str, Dict[str, os.stat_result]] = {}
+
+    def variants(self, full_path: str) -> Dict[str, os.stat_result]:
+        variants = self._variants.get(full_path)
+        if variants is None:
+            variants = {}
+            for encoding, suffix in ENCODINGS:
+                try:
+                    stat_result = os.stat(full_path + suffix)
+                except OSError:
+                    continue
+                if stat.S_ISREG(stat_result.st_mode):
+                    variants[encoding] = stat_result
+            if FINGERPRINTED.match(os.path.basename(full_path)):
+                self._variants[full_path] = variants
+        return variants
+
+    def file_response(
+        self,
+        full_path,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        full_path = str(full_path)
+        request_headers = Headers(scope=scope)
+        variants = self.variants(full_path)
+        encoding: Optional[str] = None
+        for accepted in accepted_encodings(request_headers.get("accept-encoding", "")):
+            if accepted in variants:
+                encoding = accepted
+                break
+
+        # The type of the original file, not of the compressed one
+        media_type = mimetypes.guess_type(full_path)[0] or "text/plain"
+        immutable = FINGERPRINTED.match(os.path.basename(full_path))
+        if encoding is not None:
+            full_path += dict(ENCODINGS)[encoding]
+            stat_result = variants[encoding]
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result, method=scope["method"], media_type=media_type
+        )
+        if encoding is not None:
+            response.headers["content-encoding"] = encoding
+        if variants:
+            response.headers["vary"] = "Accept-Encoding"
+        response.headers["cache-control"] = IMMUTABLE if immutable else REVALIDATE
+
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
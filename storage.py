@@ -0,0 +1,357 @@
+import base64
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from record_ids import RecordIdGenerator, claim_worker_slot
+from schemas import FormSubmission
+from settings import Settings
+from sharded_log import ShardedLog
+from submission_index import record_user
+from submission_log import Location, parse_time
+from write_queue import WriteBehindQueue
+
+# Log segments written to more recently than this are not archived yet
+COMPACTION_GRACE = 300
+
+
+class SubmissionStorage:
+    """
+    Interface every submission storage backend implements.
+
+    ``save`` hands a submission to the backend's write-behind queue and
+    returns extra fields for the submit response. The writer stamps each
+    submission with a unique ``record_id`` as it takes it for a batch, so ids
+    follow the order of the log. ``iter_logs`` is a blocking generator meant to be consumed from
+    a worker thread.
+    """
+
+    name = "base"
+
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        self.write_queue = WriteBehindQueue(
+            self.write_batch,
+            maxsize=settings.write_queue_size,
+            max_batch=settings.write_batch_size,
+            durability=settings.write_durability,
+            prepare=self.assign_id,
+        )
+        self.worker = 0
+        self._worker_lock = None
+        self.ids: Optional[RecordIdGenerator] = None
+
+    def open(self):
+        """Blocking setup (files, connections, indexes), run before start()"""
+        # Every uvicorn worker process gets its own slot for record ids and shards
+        self.worker, self._worker_lock = claim_worker_slot(os.path.join(self.settings.log_dir, "workers"))
+        self.ids = RecordIdGenerator(self.worker)
+
+    def close(self):
+        """Release files and connections, run after stop()"""
+        if self._worker_lock is not None:
+            self._worker_lock.close()
+            self._worker_lock = None
+
+    async def start(self):
+        self.write_queue.start()
+
+    async def stop(self):
+        await self.write_queue.stop()
+
+    async def save(self, submission: FormSubmission) -> Dict[str, Any]:
+        record_id = await self.write_queue.put(submission)
+        return {"record_id": record_id}
+
+    def assign_id(self, submission: FormSubmission) -> str:
+        """Give a submission its record id as the writer takes it for a batch"""
+        submission.record_id = self.ids.next()
+        return submission.record_id
+
+    def write_batch(self, batch: List[Any]):
+        """Persist a batch of queued items, called from the writer thread"""
+        raise NotImplementedError
+
+    def parse_cursor(self, cursor: str) -> Any:
+        """Turn an ``after`` cursor into a position, raising ValueError if invalid"""
+        raise NotImplementedError
+
+    def iter_logs(
+        self,
+        after: Any = None,
+        user_id: Optional[str] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield (cursor, record) for submissions matching the filters, oldest first"""
+        raise NotImplementedError
+
+    def seek(self, position: int) -> Any:
+        """The ``after`` position from which iter_logs yields record ``position`` (from 0) on (blocking)"""
+        raise NotImplementedError
+
+    def usage(self) -> Dict[str, int]:
+        """Size of the submission log in bytes and number of records in it (blocking)"""
+        raise NotImplementedError
+
+    def compact(self) -> Dict[str, int]:
+        """Archive closed periods of the log (blocking); backends without archives do nothing"""
+        return {}
+
+    def stats(self) -> Dict[str, Any]:
+        return {"backend": self.name, "write_queue": self.write_queue.stats()}
+
+
+def in_time_range(record: Dict[str, Any], since: Optional[datetime], until: Optional[datetime]) -> bool:
+    if since is None and until is None:
+        return True
+    try:
+        submitted = parse_time(record["submission_time"])
+    except (KeyError, TypeError, ValueError):
+        return False
+    return (since is None or submitted >= since) and (until is None or submitted < until)
+
+
+class JsonFileStorage(SubmissionStorage):
+    """
+    Default backend: one pretty-printed JSON file per submission plus the
+    append-only segment log, sharded per worker, and its user/day index.
+    """
+
+    name = "json"
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings)
+        self.legacy_file = os.path.join(settings.log_dir, "all_submissions.json")
+        self.log: Optional[ShardedLog] = None
+
+    def open(self):
+        super().open()
+        self.log = ShardedLog(
+            os.path.join(self.settings.log_dir, "submissions"),
+            self.worker,
+            max_bytes=self.settings.segment_max_bytes,
+            max_age=self.settings.segment_max_age,
+        )
+        self.log.open(self.legacy_file)
+
+    def close(self):
+        if self.log is not None:
+            self.log.close()
+        super().close()
+
+    def submission_filename(self, submission: FormSubmission) -> str:
+        return self.record_filename(submission.user.id if submission.user else "unknown", submission.record_id)
+
+    def record_filename(self, user_id: Any, record_id: str) -> str:
+        # The record id keeps names unique across workers and within a second
+        return os.path.join(self.settings.log_dir, f"form_submission_{user_id}_{record_id}.json")
+
+    def compact(self) -> Dict[str, int]:
+        """
+        Archive this worker's log segments of past days, then remove the
+        per-submission files of the archived records. Files of records from
+        before record ids existed are left alone.
+        """
+        log = self.log.own.log
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        segments = log.archive_closed(today, COMPACTION_GRACE)
+        removed = 0
+        for _, record in log.iter_records(segments=segments) if segments else ():
+            if not record.get("record_id"):
+                continue
+            user = record.get("user")
+            try:
+                os.remove(self.record_filename(user.get("id") if user else "unknown", record["record_id"]))
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return {"segments": len(segments), "files_removed": removed}
+
+    async def save(self, submission: FormSubmission) -> Dict[str, Any]:
+        saved = await super().save(submission)
+        saved["filename"] = self.submission_filename(submission)
+        return saved
+
+    def write_batch(self, batch: List[FormSubmission]):
+        # Common log first: one write and one fsync for the whole batch
+        self.log.commit([submission.encode() + b"\n" for submission in batch], [submission.index_fields() for submission in batch])
+
+        # Then the per-submission files; the records are stored once in the log,
+        # so a file that cannot be written must not fail the batch
+        for submission in batch:
+            try:
+                with open(self.submission_filename(submission), "wb") as f:
+                    f.write(submission.encode(indent=2))
+            except OSError as e:
+                print(f"Error writing submission file for {submission.record_id}: {str(e)}")
+
+    def usage(self) -> Dict[str, int]:
+        size, records = self.log.usage()
+        return {"bytes": size, "records": records}
+
+    def encode_cursor(self, positions: Dict[str, Location]) -> str:
+        data = json.dumps(positions, separators=(",", ":")).encode("utf-8")
+        return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+    def parse_cursor(self, cursor: str) -> Dict[str, Location]:
+        """The cursor holds the last location read from each shard"""
+        try:
+            data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+            return {str(name): (int(segment), int(offset)) for name, (segment, offset) in json.loads(data).items()}
+        except (ValueError, TypeError, AttributeError):
+            raise ValueError(f"invalid cursor {cursor!r}")
+
+    def seek(self, position: int) -> Dict[str, Location]:
+        return self.log.seek(position)
+
+    def iter_logs(self, after=None, user_id=None, since=None, until=None):
+        positions = dict(after or {})
+        for name, location, record in self.log.iter_records(positions, user_id, since, until):
+            positions[name] = location
+            if user_id is not None and record_user(record) != user_id:
+                continue
+            if not in_time_range(record, since, until):
+                continue
+            yield self.encode_cursor(positions), record
+
+
+def normalize_time(value: datetime) -> str:
+    """UTC timestamp with a fixed layout, so SQL string comparison orders correctly"""
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+class SQLiteStorage(SubmissionStorage):
+    """
+    Embedded SQLite backend in WAL mode, with indexed user id and submission
+    time columns. Inserts are batched by the write-behind queue into one
+    transaction per batch; readers open their own connections, which WAL lets
+    run concurrently with the writer.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings)
+        self.path = settings.sqlite_path
+        self._conn: Optional[sqlite3.Connection] = None
+        # Rows in the table up to row id _counted_id, kept by the writer for usage()
+        self._records = 0
+        self._counted_id = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Workers share the database file; wait for each other's write locks
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        # FULL syncs the WAL on every commit, NORMAL only at checkpoints
+        conn.execute("PRAGMA synchronous=" + ("FULL" if self.settings.write_durability == "fsync" else "NORMAL"))
+        return conn
+
+    def open(self):
+        super().open()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = self._connect()
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS submissions (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id TEXT,
+                submission_time TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS submissions_user_id ON submissions (user_id, id);
+            CREATE INDEX IF NOT EXISTS submissions_time ON submissions (submission_time);
+            """
+        )
+        self._records, self._counted_id = 0, 0
+        self._count_new_rows(self._conn)
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        super().close()
+
+    def write_batch(self, batch: List[FormSubmission]):
+        rows = []
+        for submission in batch:
+            submitted = normalize_time(submission.submission_time)
+            rows.append((record_user(submission.index_fields()), submitted, submission.model_dump_json()))
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO submissions (user_id, submission_time, data) VALUES (?, ?, ?)", rows
+            )
+            self._count_new_rows(self._conn)
+
+    def _count_new_rows(self, conn: sqlite3.Connection):
+        """
+        Add the rows inserted since the last count (this batch and other
+        workers' since our last one) with a range scan over the row ids
+        """
+        count, last = conn.execute(
+            "SELECT COUNT(*), MAX(id) FROM submissions WHERE id > ?", (self._counted_id,)
+        ).fetchone()
+        if count:
+            self._records, self._counted_id = self._records + count, last
+
+    def usage(self) -> Dict[str, int]:
+        size = 0
+        for path in (self.path, self.path + "-wal"):
+            if os.path.exists(path):
+                size += os.path.getsize(path)
+        # Counted by the writer, so scraping /metrics does not scan the table
+        return {"bytes": size, "records": self._records}
+
+    def parse_cursor(self, cursor: str) -> int:
+        try:
+            return int(cursor)
+        except ValueError:
+            raise ValueError(f"invalid cursor {cursor!r}")
+
+    def seek(self, position: int) -> int:
+        if position <= 0:
+            return 0
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT id FROM submissions ORDER BY id LIMIT 1 OFFSET ?", (position - 1,)).fetchone()
+            if row is None:
+                # Past the end: nothing to read
+                row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM submissions").fetchone()
+        finally:
+            conn.close()
+        return row[0]
+
+    def iter_logs(self, after=None, user_id=None, since=None, until=None):
+        query = "SELECT id, data FROM submissions WHERE id > ?"
+        params: List[Any] = [after or 0]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if since is not None:
+            query += " AND submission_time >= ?"
+            params.append(normalize_time(since))
+        if until is not None:
+            query += " AND submission_time < ?"
+            params.append(normalize_time(until))
+        conn = self._connect()
+        try:
+            for row_id, data in conn.execute(query + " ORDER BY id", params):
+                yield str(row_id), json.loads(data)
+        finally:
+            conn.close()
+
+
+STORAGE_BACKENDS = {
+    JsonFileStorage.name: JsonFileStorage,
+    SQLiteStorage.name: SQLiteStorage,
+}
+
+
+def create_storage(settings: Settings) -> SubmissionStorage:
+    try:
+        backend = STORAGE_BACKENDS[settings.storage_backend]
+    except KeyError:
+        raise ValueError(f"Unknown storage backend: {settings.storage_backend}")
+    return backend(settings)
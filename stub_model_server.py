@@ -0,0 +1,76 @@
+"""
+Local stand-in for the text improvement model, for testing latency and
+overload behaviour offline.
+
+    python stub_model_server.py            # listens on 127.0.0.1:8081
+    LLM_BACKEND=http python form.py        # app calls the stub
+
+Behaviour is set through the environment:
+    STUB_LATENCY_MS   base latency of each call (default 300)
+    STUB_JITTER_MS    random extra latency, 0..value (default 200)
+    STUB_CAPACITY     calls served at once; more wait in line (default 4)
+    STUB_ERROR_RATE   fraction of calls answered with 503 (default 0)
+    STUB_TOKEN_MS     delay between streamed tokens (default 50)
+"""
+import asyncio
+import json
+import os
+import random
+import re
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from text_rules import DEFAULT_RULES, RuleSet
+
+LATENCY_MS = int(os.getenv("STUB_LATENCY_MS", "300"))
+JITTER_MS = int(os.getenv("STUB_JITTER_MS", "200"))
+CAPACITY = int(os.getenv("STUB_CAPACITY", "4"))
+ERROR_RATE = float(os.getenv("STUB_ERROR_RATE", "0"))
+TOKEN_MS = int(os.getenv("STUB_TOKEN_MS", "50"))
+
+app = FastAPI()
+rules = RuleSet(DEFAULT_RULES)
+capacity = asyncio.Semaphore(CAPACITY)
+
+
+class ImproveRequest(BaseModel):
+    text: str
+
+
+@app.post("/improve")
+async def improve(request: ImproveRequest):
+    # Calls beyond capacity queue up here, like an overloaded model server
+    async with capacity:
+        await asyncio.sleep((LATENCY_MS + random.uniform(0, JITTER_MS)) / 1000)
+        if random.random() < ERROR_RATE:
+            raise HTTPException(status_code=503, detail="Model overloaded")
+        return {"improved_text": rules.apply(request.text)}
+
+
+@app.post("/improve/stream")
+async def improve_stream(request: ImproveRequest):
+    if random.random() < ERROR_RATE:
+        raise HTTPException(status_code=503, detail="Model overloaded")
+
+    async def tokens():
+        finished = False
+        async with capacity:
+            try:
+                # Time to first token
+                await asyncio.sleep((LATENCY_MS + random.uniform(0, JITTER_MS)) / 1000)
+                for token in re.findall(r"\S+\s*", rules.apply(request.text)):
+                    yield json.dumps({"delta": token}, ensure_ascii=False) + "\n"
+                    await asyncio.sleep(TOKEN_MS / 1000)
+                finished = True
+            finally:
+                if not finished:
+                    print("Stream cancelled by the client")
+
+    return StreamingResponse(tokens(), media_type="application/x-ndjson")
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host="127.0.0.1", port=int(os.getenv("STUB_PORT", "8081")))
@@ -0,0 +1,214 @@
+import bisect
+import heapq
+import json
+import os
+import threading
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from record_offsets import RecordOffsets
+from submission_log import Location, SegmentLog, parse_time
+
+# Records are indexed in chunks while rebuilding so the log is never held in memory
+REBUILD_CHUNK = 1000
+
+
+def record_user(record: Dict[str, Any]) -> Optional[str]:
+    user_id = (record.get("user") or {}).get("id")
+    return None if user_id in (None, "") else str(user_id)
+
+
+def record_day(record: Dict[str, Any]) -> Optional[str]:
+    try:
+        return parse_time(record["submission_time"]).astimezone(timezone.utc).date().isoformat()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class SubmissionIndex:
+    """
+    Secondary indexes over a SegmentLog: user id and submission day -> locations.
+
+    The index lives in memory and is persisted as an append-only sidecar file
+    with one ``[segment, offset, user_id, day]`` line per record, so keeping it
+    up to date costs one small append per write batch. On ``load`` a missing or
+    unreadable sidecar is rebuilt from the log, one that points past the end of
+    the log is rebuilt, and one that is merely behind is caught up by indexing
+    only the log tail.
+
+    Next to the sidecar, ``offsets`` keeps the location of every record by
+    its number in the log (see record_offsets.RecordOffsets), for reading any
+    record or page without scanning what precedes it. If it disagrees with the
+    sidecar both are rebuilt, in the same single pass over the log.
+
+    A read-only index (``writable=False``) follows a log written by another
+    process: it never touches its files and ``refresh`` indexes, in memory,
+    whatever the owner appended since.
+    """
+
+    def __init__(self, log: SegmentLog, path: str, writable: bool = True, offsets_path: Optional[str] = None):
+        self.log = log
+        self.path = path
+        self.writable = writable
+        self.offsets = RecordOffsets(offsets_path or os.path.splitext(path)[0] + ".offsets", writable)
+        self._lock = threading.Lock()
+        self._file = None
+        self._reset()
+
+    def _reset(self):
+        self.by_user: Dict[str, List[Location]] = defaultdict(list)
+        self.by_day: Dict[str, List[Location]] = defaultdict(list)
+        # The keys of by_day, in order
+        self.days: List[str] = []
+        self.last: Optional[Location] = None
+        self.count = 0
+
+    def _add(self, location: Location, user_id: Optional[str], day: Optional[str]):
+        if user_id is not None:
+            self.by_user[user_id].append(location)
+        if day is not None:
+            if day not in self.by_day:
+                bisect.insort(self.days, day)
+            self.by_day[day].append(location)
+        self.last = location
+        self.count += 1
+
+    def _read_sidecar(self) -> bool:
+        """Load the sidecar into memory; False if it is missing or damaged"""
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        if not self.writable:
+                            # The owner is still writing this line
+                            break
+                        raise ValueError("torn index line")
+                    segment, offset, user_id, day = json.loads(line)
+                    self._add((segment, offset), user_id, day)
+        except FileNotFoundError:
+            return False
+        except (ValueError, TypeError):
+            self._reset()
+            return False
+        return True
+
+    def load(self):
+        """Load the sidecar, rebuilding or catching it up with the log as needed"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.offsets.close()
+            self._reset()
+            fresh = self._read_sidecar()
+            if fresh and self.last is not None and not self.log.contains(self.last):
+                # The index refers to records the log no longer has
+                self._reset()
+                fresh = False
+            if fresh and self.writable and not self._offsets_match():
+                self._reset()
+                fresh = False
+            if self.writable:
+                if not fresh:
+                    os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                    open(self.path, "wb").close()
+                self._file = open(self.path, "ab")
+                self.offsets.open(truncate=not fresh)
+            self._catch_up()
+
+    def _offsets_match(self) -> bool:
+        """Whether the offsets file ends with the record the sidecar ends with"""
+        if self.offsets.count() != self.count:
+            return False
+        return self.count == 0 or self.offsets.get(self.count - 1) == self.last
+
+    def refresh(self):
+        """Index records appended to the log by its (other) owner since the last call"""
+        with self._lock:
+            self._catch_up()
+
+    def _catch_up(self):
+        start = self.last
+        pending = []
+        for location, record in self.log.iter_records(start):
+            if location == start:
+                continue
+            pending.append((location, record))
+            if len(pending) == REBUILD_CHUNK:
+                self._append(pending)
+                pending = []
+        if pending:
+            self._append(pending)
+
+    def _append(self, entries: List[Tuple[Location, Dict[str, Any]]]):
+        lines = []
+        for location, record in entries:
+            user_id, day = record_user(record), record_day(record)
+            self._add(location, user_id, day)
+            lines.append(json.dumps([location[0], location[1], user_id, day], ensure_ascii=False) + "\n")
+        if self._file is not None:
+            self._file.write("".join(lines).encode("utf-8"))
+            self._file.flush()
+            self.offsets.append(location for location, _ in entries)
+
+    def add_many(self, locations: List[Location], records: List[Dict[str, Any]]):
+        """Index freshly appended records"""
+        with self._lock:
+            self._append(list(zip(locations, records)))
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+            self.offsets.close()
+
+    def location(self, number: int) -> Optional[Location]:
+        """Location of record ``number`` (from 0, in log order), or None past the end"""
+        found = self.offsets.get(number)
+        if found is not None or number >= self.count:
+            return found
+        # The owner has not written this far into the offsets file yet
+        known = self.offsets.count()
+        start = self.offsets.get(known - 1) if known else None
+        current = known - 1
+        for location, _ in self.log.iter_records(start):
+            if location == start:
+                continue
+            current += 1
+            if current == number:
+                return location
+        return None
+
+    def lookup_user(self, user_id: str, after: Optional[Location] = None) -> List[Location]:
+        """Locations of a user's records (after ``after``), oldest first"""
+        with self._lock:
+            locations = self.by_user.get(user_id, [])
+            start = bisect.bisect_right(locations, after) if after is not None else 0
+            return locations[start:]
+
+    def lookup_days(
+        self,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        after: Optional[Location] = None,
+    ) -> Iterator[Location]:
+        """
+        Locations of records submitted on the days overlapping [since, until),
+        oldest first. The days' lists are merged lazily, so a caller reading
+        one page pays for that page, not for the whole range.
+        """
+        # Day buckets are UTC dates
+        first = since.astimezone(timezone.utc).date().isoformat() if since is not None else None
+        last = until.astimezone(timezone.utc).date().isoformat() if until is not None else None
+        with self._lock:
+            low = bisect.bisect_left(self.days, first) if first is not None else 0
+            high = bisect.bisect_right(self.days, last) if last is not None else len(self.days)
+            slices = []
+            for day in self.days[low:high]:
+                day_locations = self.by_day[day]
+                start = bisect.bisect_right(day_locations, after) if after is not None else 0
+                # Lists only grow; the end is fixed now so the merge needs no lock
+                slices.append(map(day_locations.__getitem__, range(start, len(day_locations))))
+        return heapq.merge(*slices)
@@ -0,0 +1,358 @@
+import json
+import mmap
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from archive import ARCHIVE_PREFIX, ARCHIVE_SUFFIX, Archive, archive_name, write_archive
+
+# A record location is (segment number, byte offset of its line)
+Location = Tuple[int, int]
+
+SEGMENT_PREFIX = "segment-"
+SEGMENT_SUFFIX = ".ndjson"
+
+
+def encode_record(record: Dict[str, Any]) -> bytes:
+    """Serialize a record as one compact NDJSON line"""
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def utc_day(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def parse_time(value: str) -> datetime:
+    """Parse an ISO 8601 timestamp, treating naive values as UTC"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def map_file(path: str) -> Optional[mmap.mmap]:
+    """Read-only memory map of a file as it is now, or None if it is empty"""
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        return mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) if size else None
+
+
+def _unmap(data):
+    if isinstance(data, mmap.mmap):
+        data.close()
+
+
+class SegmentLog:
+    """
+    Append-only log of JSON records stored as NDJSON segment files.
+
+    Every record is a single line appended to the active segment, so adding a
+    record costs O(1) no matter how much history exists. The active segment is
+    closed and a new one started once it grows past ``max_bytes``, was
+    created more than ``max_age`` seconds ago or a new (UTC) day began, so
+    every segment belongs to one day. Segment files are named
+    ``segment-<number>-<created unix time>.ndjson``.
+
+    ``archive_closed`` moves the segments of past days into one compressed
+    archive per day (see archive.Archive); records keep their locations and
+    every read method covers archived and live segments alike.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024, max_age: int = 24 * 60 * 60):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._file = None
+        self._segment = 0
+        self._created = 0
+        self._size = 0
+        # Guards the active segment against archive_closed
+        self._lock = threading.Lock()
+        # Parsed archives by file name, with the (mtime, size) they were read at
+        self._archives: Dict[str, Tuple[Tuple[int, int], Archive]] = {}
+
+    def segments(self) -> List[Tuple[int, int]]:
+        """Return (segment number, created time) for every segment, oldest first"""
+        if not os.path.isdir(self.directory):
+            return []
+        found = []
+        for name in os.listdir(self.directory):
+            if not (name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)):
+                continue
+            try:
+                number, created = name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)].split("-")
+                found.append((int(number), int(created)))
+            except ValueError:
+                continue
+        return sorted(found)
+
+    def segment_path(self, number: int, created: int) -> str:
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{number:08d}-{created}{SEGMENT_SUFFIX}")
+
+    def archives(self) -> Dict[int, Archive]:
+        """Archived segments: segment number -> the archive holding it"""
+        found: Dict[int, Archive] = {}
+        if not os.path.isdir(self.directory):
+            return found
+        for name in os.listdir(self.directory):
+            if not (name.startswith(ARCHIVE_PREFIX) and name.endswith(ARCHIVE_SUFFIX)):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+                key = (stat.st_mtime_ns, stat.st_size)
+                cached = self._archives.get(name)
+                if cached is None or cached[0] != key:
+                    cached = self._archives[name] = (key, Archive(path))
+            except (OSError, ValueError):
+                continue
+            for number in cached[1].segments:
+                found[number] = cached[1]
+        return found
+
+    def _catalog(self) -> List[Tuple[int, Optional[int], Optional[Archive]]]:
+        """(number, created time if live, archive if archived) for every segment, oldest first"""
+        live = dict(self.segments())
+        archived = self.archives()
+        return [(number, live.get(number), archived.get(number)) for number in sorted(set(live) | set(archived))]
+
+    def _open(self, number: int, created: int):
+        self._file = open(self.segment_path(number, created), "ab")
+        self._segment = number
+        self._created = created
+        self._size = self._file.tell()
+
+    def _ensure_open(self):
+        if self._file is not None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        existing = self.segments()
+        if existing:
+            self._open(*existing[-1])
+        else:
+            # Numbers continue after the archived segments
+            self._open(max(self.archives(), default=0) + 1, int(time.time()))
+
+    def _rotate_if_needed(self):
+        now = time.time()
+        expired = now - self._created >= self.max_age or utc_day(now) != utc_day(self._created)
+        if self._size and (self._size >= self.max_bytes or expired):
+            self._file.close()
+            self._open(self._segment + 1, int(time.time()))
+
+    def append(self, record: Dict[str, Any]) -> Location:
+        """Append one record and return its location"""
+        return self.append_many([record])[0]
+
+    def append_many(self, records: Iterable[Dict[str, Any]]) -> List[Location]:
+        """Append several records with a single write and return their locations"""
+        return self.append_lines([encode_record(record) for record in records])
+
+    def append_lines(self, lines: List[bytes]) -> List[Location]:
+        """Append already encoded records (one NDJSON line each) with a single write"""
+        with self._lock:
+            self._ensure_open()
+            self._rotate_if_needed()
+            locations = []
+            offset = self._size
+            for line in lines:
+                locations.append((self._segment, offset))
+                offset += len(line)
+            self._file.write(b"".join(lines))
+            self._file.flush()
+            self._size = offset
+        return locations
+
+    def size(self) -> int:
+        """Bytes in all segments and archives (compressed)"""
+        total = 0
+        for number, created in self.segments():
+            try:
+                total += os.path.getsize(self.segment_path(number, created))
+            except FileNotFoundError:
+                pass
+        for archive in {archive.path: archive for archive in self.archives().values()}.values():
+            try:
+                total += os.path.getsize(archive.path)
+            except FileNotFoundError:
+                pass
+        return total
+
+    def sync(self):
+        """Force appended records to disk"""
+        with self._lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def contains(self, location: Location) -> bool:
+        """Whether a record can start at ``location`` (its segment exists and is long enough)"""
+        number, offset = location
+        for candidate, created, archive in self._catalog():
+            if candidate != number:
+                continue
+            if created is not None:
+                try:
+                    return os.path.getsize(self.segment_path(number, created)) > offset
+                except OSError:
+                    pass
+            return archive is not None and archive.segment_size(number) > offset
+        return False
+
+    def archive_closed(self, before: str, grace: float) -> List[int]:
+        """
+        Move the segments of days before ``before`` (``YYYY-MM-DD``, UTC) into
+        their day's archive and remove them; returns their numbers. Segments
+        written to within ``grace`` seconds are left for a later run. Only the
+        process appending to the log may call this.
+        """
+        now = time.time()
+        by_day: Dict[str, List[Tuple[int, str]]] = {}
+        with self._lock:
+            for number, created in self.segments():
+                path = self.segment_path(number, created)
+                if utc_day(created) >= before or os.path.getmtime(path) > now - grace:
+                    continue
+                if self._file is not None and number == self._segment:
+                    # Idle since its day ended; the next append starts a new segment
+                    self._file.close()
+                    self._file = None
+                by_day.setdefault(utc_day(created), []).append((number, path))
+
+        # Closed segments never change, so the archives are written without the lock
+        archived = []
+        for day, segments in sorted(by_day.items()):
+            write_archive(os.path.join(self.directory, archive_name(day)), segments)
+            for number, path in segments:
+                os.remove(path)
+                archived.append(number)
+        return archived
+
+    def read_at(self, locations: Iterable[Location]) -> Iterator[Tuple[Location, Dict[str, Any]]]:
+        """
+        Yield (location, record) for the given locations, parsing only those
+        lines: live segments are memory-mapped, so each record is a slice of
+        the map, and archived ones are read a block at a time.
+        """
+        catalog = {number: (created, archive) for number, created, archive in self._catalog()}
+        # What ``data`` holds: a live segment's number or an archive block, starting at ``base``
+        source, data, base = None, b"", 0
+        try:
+            for location in locations:
+                number, offset = location
+                created, archive = catalog.get(number, (None, None))
+                if created is not None and source != number:
+                    try:
+                        mapped = map_file(self.segment_path(number, created))
+                    except FileNotFoundError:
+                        # Archived since the catalog was read
+                        created, archive = None, self.archives().get(number)
+                        catalog[number] = (created, archive)
+                    else:
+                        _unmap(data)
+                        source, data, base = number, mapped or b"", 0
+                if created is None:
+                    found = archive.find(number, offset) if archive is not None else None
+                    if found is None:
+                        continue
+                    if found != source:
+                        _unmap(data)
+                        source, data, base = found, archive.read_block(found), found.offset
+                start = offset - base
+                end = data.find(b"\n", start)
+                if start >= len(data) or end < 0:
+                    continue
+                try:
+                    yield location, json.loads(data[start:end + 1])
+                except json.JSONDecodeError:
+                    continue
+        finally:
+            _unmap(data)
+
+    def _lines(self, number: int, created: Optional[int], archive: Optional[Archive], start: int) -> Iterator[Tuple[int, bytes]]:
+        """(offset, line) for the lines of one segment, live or archived, from ``start`` on"""
+        if created is not None:
+            try:
+                data = map_file(self.segment_path(number, created))
+            except FileNotFoundError:
+                # Archived since the catalog was read
+                archive = self.archives().get(number)
+            else:
+                if data is None:
+                    return
+                with data:
+                    position = start
+                    while position < len(data):
+                        end = data.find(b"\n", position)
+                        end = len(data) if end < 0 else end + 1
+                        yield position, data[position:end]
+                        position = end
+                return
+        if archive is not None:
+            yield from archive.iter_lines(number, start)
+
+    def iter_records(
+        self, start: Optional[Location] = None, segments: Optional[Iterable[int]] = None
+    ) -> Iterator[Tuple[Location, Dict[str, Any]]]:
+        """
+        Yield (location, record) pairs in append order, starting at ``start``
+        (and only from ``segments``, if given).
+
+        Live segments are memory-mapped and archives read a block at a time,
+        so only one line (or one archive block) is copied at a time. A torn
+        final line (a write that was interrupted before its newline) is
+        skipped.
+        """
+        wanted = set(segments) if segments is not None else None
+        for number, created, archive in self._catalog():
+            if start is not None and number < start[0]:
+                continue
+            if wanted is not None and number not in wanted:
+                continue
+            begin = start[1] if start is not None and number == start[0] else 0
+            for offset, line in self._lines(number, created, archive, begin):
+                if not line.endswith(b"\n") or not line.strip():
+                    continue
+                try:
+                    yield (number, offset), json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    def import_legacy(self, legacy_file: str, batch_size: int = 1000) -> int:
+        """
+        One-time import of the old ``all_submissions.json`` array into the log.
+
+        The legacy file is renamed to ``<name>.imported`` afterwards so the
+        import never runs twice. Returns the number of imported records.
+        """
+        if not os.path.exists(legacy_file):
+            return 0
+        with open(legacy_file, "r", encoding="utf-8") as f:
+            try:
+                records = json.load(f)
+            except json.JSONDecodeError:
+                records = []
+        if not isinstance(records, list):
+            records = [records]
+        for i in range(0, len(records), batch_size):
+            self.append_many(records[i:i + batch_size])
+        self.sync()
+        os.replace(legacy_file, legacy_file + ".imported")
+        return len(records)
+
+
+if __name__ == "__main__":
+    # Usage: python submission_log.py <legacy all_submissions.json> [log directory]
+    legacy = sys.argv[1] if len(sys.argv) > 1 else "logs/all_submissions.json"
+    directory = sys.argv[2] if len(sys.argv) > 2 else "logs/submissions"
+    log = SegmentLog(directory)
+    print(f"Imported {log.import_legacy(legacy)} records into {directory}")
+    log.close()
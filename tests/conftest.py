@@ -0,0 +1,39 @@
+import os
+import sys
+
+# The app's modules live at the top of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from fastapi.testclient import TestClient
+
+from form import create_app
+from settings import Settings
+
+
+@pytest.fixture
+def app_client(tmp_path):
+    """
+    Start the app with its files under tmp_path and return a TestClient;
+    keyword arguments override the settings
+    """
+    clients = []
+
+    def start(**overrides) -> TestClient:
+        settings = Settings(**{
+            "log_dir": str(tmp_path / "logs"),
+            "sqlite_path": str(tmp_path / "logs" / "submissions.db"),
+            "upload_dir": str(tmp_path / "uploads"),
+            "static_dir": str(tmp_path / "static"),
+            "text_rules_file": str(tmp_path / "text_rules.json"),
+            "image_workers": 1,
+            **overrides,
+        })
+        client = TestClient(create_app(settings))
+        client.__enter__()
+        clients.append(client)
+        return client
+
+    yield start
+    for client in reversed(clients):
+        client.__exit__(None, None, None)
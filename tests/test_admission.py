@@ -0,0 +1,96 @@
+import pytest
+
+import admission
+from admission import AdmissionError, RateLimiter, create_admission
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def test_bucket_allows_the_burst_then_the_rate(clock):
+    limiter = RateLimiter(rate=2, burst=3)
+    assert [limiter.take("a") for _ in range(3)] == [0, 0, 0]
+    assert limiter.take("a") == pytest.approx(0.5)
+    clock.now += 0.5
+    assert limiter.take("a") == 0
+    # Refills only up to the burst
+    clock.now += 60
+    assert [limiter.take("a") for _ in range(4)] == [0, 0, 0, pytest.approx(0.5)]
+    assert limiter.stats()["limited"] == 2
+
+
+def test_clients_have_their_own_buckets(clock):
+    limiter = RateLimiter(rate=1, burst=1)
+    assert limiter.take("a") == 0
+    assert limiter.take("a") > 0
+    assert limiter.take("b") == 0
+
+
+def test_cost_above_the_burst_empties_the_bucket(clock):
+    limiter = RateLimiter(rate=1, burst=5)
+    assert limiter.take("a", cost=50) == 0
+    assert limiter.take("a") == pytest.approx(1)
+
+
+def test_only_recent_clients_are_kept(clock):
+    limiter = RateLimiter(rate=1, burst=1, max_clients=2)
+    for client in ("a", "b", "a", "c"):
+        limiter.take(client)
+    assert limiter.stats()["clients"] == 2
+    # "b" was dropped, so it starts with a full bucket again
+    assert limiter.take("b") == 0
+    assert limiter.take("c") > 0
+
+
+def test_address_limit_catches_changing_user_ids(clock):
+    control = create_admission({"submit": (60, 2)}, 1000, address_factor=2.0)
+    for user in range(4):
+        control.admit("submit", f"user:{user}", address="ip:1")
+    with pytest.raises(AdmissionError) as error:
+        control.admit("submit", "user:99", address="ip:1")
+    assert error.value.status_code == 429
+    assert error.value.retry_after == 1
+    control.admit("submit", "user:99", address="ip:2")
+
+
+def test_refused_by_address_costs_the_client_nothing(clock):
+    control = create_admission({"submit": (60, 2)}, 1000, address_factor=0.5)
+    control.admit("submit", "user:1", address="ip:1")
+    with pytest.raises(AdmissionError):
+        control.admit("submit", "user:1", address="ip:1")
+    control.admit("submit", "user:1", address="ip:2")
+
+
+def test_zero_rate_means_no_limit(clock):
+    control = create_admission({"submit": (0, 1), "improve": (60, 1)}, 1000, address_factor=10)
+    for _ in range(100):
+        control.admit("submit", "user:1", address="ip:1")
+    assert set(control.stats()["limits"]) == set(control.stats()["address_limits"]) == {"improve"}
+
+
+def test_submit_is_limited_but_replays_are_not(app_client):
+    client = app_client(submit_rate=60, submit_burst=2)
+    submission = {"events": [{"title": "Event", "source": "test"}], "user": {"id": 5}}
+    headers = {"Idempotency-Key": "submit-once-1"}
+    first = client.post("/api/submit-form", json=submission, headers=headers)
+    assert first.status_code == 200
+    assert client.post("/api/submit-form", json=submission).status_code == 200
+    refused = client.post("/api/submit-form", json=submission)
+    assert refused.status_code == 429
+    assert int(refused.headers["retry-after"]) >= 1
+    # A retry of the first submission still gets its stored reply
+    again = client.post("/api/submit-form", json=submission, headers=headers)
+    assert again.status_code == 200
+    assert again.json() == first.json()
@@ -0,0 +1,124 @@
+import gzip
+import os
+
+import pytest
+
+import submission_log
+from archive import Archive, archive_name, write_archive
+from submission_log import SegmentLog
+
+DAY = 24 * 60 * 60
+# 2026-01-01T00:00:00Z
+START = 1767225600
+
+
+class Clock:
+    def __init__(self, now: float):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock(START + 3600)
+    monkeypatch.setattr(submission_log.time, "time", clock)
+    return clock
+
+
+def fill(log: SegmentLog, clock: Clock, days: int, per_day: int):
+    """Append ``per_day`` records on each of ``days`` days"""
+    for day in range(days):
+        clock.now = START + day * DAY + 3600
+        for i in range(per_day):
+            log.append({"record_id": f"{day:03d}-{i:05d}", "text": "x" * (i % 50)})
+    log.sync()
+    age(log)
+
+
+def age(log: SegmentLog):
+    """Give the segments the modification times they would have had"""
+    for number, created in log.segments():
+        os.utime(log.segment_path(number, created), (created + 60, created + 60))
+
+
+def snapshot(log: SegmentLog):
+    return list(log.iter_records())
+
+
+def test_records_unchanged_after_archiving(tmp_path, clock):
+    log = SegmentLog(str(tmp_path), max_bytes=4096)
+    fill(log, clock, days=3, per_day=200)
+    before = snapshot(log)
+    live = {number: open(log.segment_path(number, created), "rb").read() for number, created in log.segments()}
+
+    clock.now = START + 3 * DAY
+    archived = log.archive_closed("2026-01-03", grace=60)
+
+    assert archived
+    assert {number for number, _ in log.segments()}.isdisjoint(archived)
+    assert snapshot(log) == before
+    assert list(log.read_at(location for location, _ in before)) == before
+    # Reading from the middle of an archived segment
+    middle = len(before) // 3
+    assert list(log.iter_records(before[middle][0])) == before[middle:]
+    # Each archive is plain gzip of its segments
+    for day in ("2026-01-01", "2026-01-02"):
+        archive = Archive(str(tmp_path / archive_name(day)))
+        expected = b"".join(live[number] for number in archive.segments)
+        assert gzip.decompress((tmp_path / archive_name(day)).read_bytes()) == expected
+
+    log.close()
+    reopened = SegmentLog(str(tmp_path), max_bytes=4096)
+    assert snapshot(reopened) == before
+    # New segments are numbered after the archived ones
+    location = reopened.append({"record_id": "new"})
+    assert location[0] > max(archived)
+    reopened.close()
+
+
+def test_archiving_again_keeps_earlier_segments(tmp_path, clock):
+    log = SegmentLog(str(tmp_path), max_bytes=2048)
+    fill(log, clock, days=1, per_day=100)
+    clock.now = START + 3 * 3600
+    first = log.archive_closed("2026-01-02", grace=60)
+    # More records of the same day, written after the first run
+    clock.now = START + 4 * 3600
+    for i in range(100):
+        log.append({"record_id": f"late-{i:05d}"})
+    log.sync()
+    age(log)
+    before = snapshot(log)
+
+    clock.now = START + DAY
+    second = log.archive_closed("2026-01-02", grace=60)
+
+    assert first and second and set(first).isdisjoint(second)
+    assert log.segments() == []
+    assert snapshot(log) == before
+    assert len(os.listdir(tmp_path)) == 1
+
+
+def test_write_archive_skips_archived_segments(tmp_path):
+    segment = tmp_path / "segment"
+    segment.write_bytes(b'{"a":1}\n{"a":2}\n')
+    path = str(tmp_path / archive_name("2026-01-01"))
+    write_archive(path, [(1, str(segment))])
+    size = os.path.getsize(path)
+
+    write_archive(path, [(1, str(segment))])
+
+    assert os.path.getsize(path) == size
+    assert list(Archive(path).iter_lines(1)) == [(0, b'{"a":1}\n'), (8, b'{"a":2}\n')]
+
+
+def test_damaged_archive_is_rejected(tmp_path):
+    segment = tmp_path / "segment"
+    segment.write_bytes(b'{"a":1}\n')
+    path = tmp_path / archive_name("2026-01-01")
+    write_archive(str(path), [(1, str(segment))])
+    path.write_bytes(path.read_bytes()[:-3])
+
+    with pytest.raises(ValueError):
+        Archive(str(path))
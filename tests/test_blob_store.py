@@ -0,0 +1,132 @@
+import hashlib
+import os
+
+import pytest
+
+import blob_store
+from blob_store import BlobStore
+
+HOUR = 3600
+
+
+class Clock:
+    def __init__(self, now: float = 1767225600.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(blob_store.time, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def store(tmp_path, clock):
+    store = BlobStore(str(tmp_path))
+    store.open()
+    yield store
+    store.close()
+
+
+def put(store: BlobStore, content: bytes) -> str:
+    """Store ``content`` like an upload does and return its hash"""
+    digest = hashlib.sha256(content).hexdigest()
+    temp = store.temp_path(os.urandom(8).hex())
+    with open(temp, "wb") as f:
+        f.write(content)
+    store.commit(temp, digest, len(content))
+    return digest
+
+
+def age(path: str, clock: Clock):
+    """Give a file the fake clock's time, which gc compares file times with"""
+    os.utime(path, (clock.now, clock.now))
+
+
+def test_same_content_is_stored_once(store):
+    first = put(store, b"photo")
+    second = put(store, b"photo")
+    assert first == second
+    assert store.stats()["blobs"] == 1
+    assert store.stats()["deduplicated"] == 1
+    assert os.listdir(store.tmp_dir) == []
+
+
+def test_references_are_counted(store):
+    digest = put(store, b"photo")
+    store.add_refs([digest, digest])
+    assert store.stats()["references"] == 2
+    store.release_refs([digest])
+    store.release_refs([digest, digest])
+    # Never below zero
+    assert store.stats()["references"] == 0
+
+
+def test_unknown_blob_adds_no_references(store):
+    digest = put(store, b"photo")
+    with pytest.raises(KeyError):
+        store.add_refs([digest, "0" * 64])
+    assert store.stats()["references"] == 0
+
+
+def test_gc_keeps_referenced_and_recent_blobs(store, clock):
+    referenced, fresh = put(store, b"referenced"), put(store, b"fresh upload")
+    store.add_refs([referenced])
+    clock.now += 2 * HOUR
+    stale = put(store, b"never submitted")
+    released = put(store, b"submission failed")
+    store.add_refs([released])
+    store.release_refs([released])
+    for digest in (referenced, fresh, stale, released):
+        age(store.blob_path(digest), clock)
+    clock.now += 2 * HOUR
+
+    # The reference update touched ``released``, so only ``fresh`` is past a 3 hour grace
+    assert store.gc(3 * HOUR) == {"removed": 1, "freed_bytes": len(b"fresh upload"), "strays": 0}
+    assert not os.path.exists(store.blob_path(fresh))
+    assert store.gc(HOUR)["removed"] == 2
+    assert os.path.exists(store.blob_path(referenced))
+    assert store.stats()["blobs"] == 1
+
+
+def test_gc_removes_stray_files_after_the_grace(store, clock):
+    temp = store.temp_path("interrupted")
+    with open(temp, "wb") as f:
+        f.write(b"half an upload")
+    untracked = store.blob_path("f" * 64)
+    os.makedirs(os.path.dirname(untracked))
+    with open(untracked, "wb") as f:
+        f.write(b"lost")
+    age(temp, clock)
+    age(untracked, clock)
+    assert store.gc(HOUR)["strays"] == 0
+    clock.now += 2 * HOUR
+    assert store.gc(HOUR)["strays"] == 2
+    assert not os.path.exists(temp) and not os.path.exists(untracked)
+
+
+def test_references_survive_reopening(tmp_path, store):
+    digest = put(store, b"photo")
+    store.add_refs([digest])
+    store.close()
+    reopened = BlobStore(str(tmp_path))
+    reopened.open()
+    assert reopened.stats()["references"] == 1
+    reopened.close()
+
+
+def test_submissions_reference_their_attachments(app_client):
+    client = app_client()
+    upload = client.post("/api/upload", files={"textFiles1": ("notes.txt", b"notes", "text/plain")}).json()["files"][0]
+    event = {"title": "Event", "source": "test", "attachments": [upload]}
+    assert client.post("/api/submit-form", json={"events": [event, event]}).status_code == 200
+    assert client.get("/api/status").json()["attachments"]["references"] == 2
+
+    unknown = dict(upload, sha256="0" * 64)
+    response = client.post("/api/submit-form", json={"events": [event, {**event, "attachments": [unknown]}]})
+    assert response.status_code == 400
+    assert client.get("/api/status").json()["attachments"]["references"] == 2
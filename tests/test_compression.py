@@ -0,0 +1,100 @@
+import gzip
+import re
+
+import brotli
+import pytest
+
+from compression import MIN_COMPRESS_SIZE, Representation, RepresentationCache, accepted_encodings
+
+BODY = ("Событие в парке. " * 200).encode("utf-8")
+
+
+def decode(body: bytes, encoding: str) -> bytes:
+    return brotli.decompress(body) if encoding == "br" else gzip.decompress(body)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("gzip, deflate, br", ["br", "gzip"]),
+    ("gzip", ["gzip"]),
+    ("br;q=0, gzip;q=0.5", ["gzip"]),
+    ("*", ["br", "gzip"]),
+    ("*, br;q=0", ["gzip"]),
+    ("identity", []),
+    ("", []),
+])
+def test_accepted_encodings(header, expected):
+    assert accepted_encodings(header) == expected
+
+
+@pytest.mark.parametrize("encoding", ["br", "gzip"])
+def test_representation_is_compressed_as_accepted(encoding):
+    response = Representation(BODY, "text/plain").response({"accept-encoding": encoding})
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert decode(response.body, encoding) == BODY
+
+
+def test_small_bodies_are_sent_as_they_are():
+    body = b"x" * (MIN_COMPRESS_SIZE - 1)
+    response = Representation(body, "text/plain").response({"accept-encoding": "gzip"})
+    assert response.body == body
+    assert "content-encoding" not in response.headers
+    assert "vary" not in response.headers
+
+
+def test_any_variant_etag_revalidates():
+    representation = Representation(BODY, "text/plain")
+    etags = {representation.response({"accept-encoding": encoding}).headers["etag"] for encoding in ("br", "gzip", "")}
+    assert len(etags) == 3
+    for etag in etags:
+        response = representation.response({"accept-encoding": "gzip", "if-none-match": f"W/{etag}"})
+        assert response.status_code == 304
+        assert response.headers["etag"] == representation.etag("gzip")
+    changed = Representation(BODY + b"!", "text/plain")
+    assert changed.response({"if-none-match": ", ".join(etags)}).status_code == 200
+
+
+def test_cache_reuses_compressed_variants():
+    cache = RepresentationCache()
+    first = cache.get(BODY, "application/json")
+    first.encoded("gzip")
+    assert cache.get(BODY, "application/json") is first
+    assert cache.get(BODY, "text/plain") is not first
+    assert cache.stats()["hits"] == 1
+
+
+def test_root_page_revalidates(app_client):
+    client = app_client()
+    response = client.get("/", headers={"accept-encoding": "br"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["cache-control"] == "no-cache"
+    assert client.get("/", headers={"if-none-match": response.headers["etag"]}).status_code == 304
+
+
+def test_built_assets_are_served_precompressed(app_client):
+    client = app_client()
+    page = client.get("/", headers={"accept-encoding": "identity"}).text
+    paths = re.findall(r'"(/static/[^"]+\.[0-9a-f]{12}\.(?:css|js))"', page)
+    assert paths
+    for path in paths:
+        plain = client.get(path, headers={"accept-encoding": "identity"})
+        assert plain.headers["cache-control"] == "public, max-age=31536000, immutable"
+        for encoding in ("br", "gzip"):
+            # Read the bytes as sent, without the client decoding them
+            with client.stream("GET", path, headers={"accept-encoding": encoding}) as response:
+                assert response.headers["content-encoding"] == encoding
+                assert response.headers["vary"] == "Accept-Encoding"
+                assert decode(b"".join(response.iter_raw()), encoding) == plain.content
+                etag = response.headers["etag"]
+            assert client.get(path, headers={"accept-encoding": encoding, "if-none-match": etag}).status_code == 304
+
+
+def test_logs_pages_revalidate(app_client):
+    client = app_client(submit_rate=0)
+    for n in range(40):
+        assert client.post("/api/submit-form", json={"events": [{"title": f"Event {n}", "source": "test"}]}).status_code == 200
+    response = client.get("/logs?format=json", headers={"accept-encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert len(response.json()["logs"]) == 40
+    assert client.get("/logs?format=json", headers={"if-none-match": response.headers["etag"]}).status_code == 304
@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyError, IdempotencyTable
+
+KEY = "3f1c2a4e-key"
+SUBMISSION = {"events": [{"title": "Event", "source": "test"}], "user": {"id": 5}}
+
+
+@pytest.fixture
+def table(tmp_path):
+    table = IdempotencyTable(str(tmp_path / "idempotency.db"))
+    table.open()
+    yield table
+    table.close()
+
+
+def test_repeat_gets_the_stored_result(table):
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return {"record_id": str(len(calls))}
+
+    async def main():
+        first = await table.run(KEY, "a", compute)
+        again = await table.run(KEY, "a", compute)
+        return first, again
+
+    assert asyncio.run(main()) == (({"record_id": "1"}, False), ({"record_id": "1"}, True))
+    assert len(calls) == 1
+
+
+def test_stored_result_survives_restart(tmp_path, table):
+    async def compute():
+        return {"record_id": "1"}
+
+    asyncio.run(table.run(KEY, "a", compute))
+    table.close()
+    reopened = IdempotencyTable(str(tmp_path / "idempotency.db"))
+    reopened.open()
+    try:
+        assert asyncio.run(reopened.run(KEY, "a", compute)) == ({"record_id": "1"}, True)
+        with pytest.raises(IdempotencyError) as error:
+            asyncio.run(reopened.run(KEY, "b", compute))
+        assert error.value.status_code == 422
+    finally:
+        reopened.close()
+
+
+def test_key_reused_for_another_request_is_rejected(table):
+    async def compute():
+        return {"record_id": "1"}
+
+    asyncio.run(table.run(KEY, "a", compute))
+    with pytest.raises(IdempotencyError) as error:
+        asyncio.run(table.run(KEY, "b", compute))
+    assert error.value.status_code == 422
+
+
+def test_concurrent_repeats_wait_for_the_original(table):
+    calls = []
+
+    async def main():
+        release = asyncio.Event()
+
+        async def compute():
+            calls.append(1)
+            await release.wait()
+            return {"record_id": "1"}
+
+        runs = [asyncio.ensure_future(table.run(KEY, "a", compute)) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        release.set()
+        return await asyncio.gather(*runs)
+
+    results = asyncio.run(main())
+    assert sorted(replayed for _, replayed in results) == [False, True, True]
+    assert len(calls) == 1
+
+
+def test_pending_key_in_another_worker_conflicts(tmp_path, table):
+    other = IdempotencyTable(str(tmp_path / "idempotency.db"))
+    other.open()
+
+    async def main():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def compute():
+            started.set()
+            await release.wait()
+            return {"record_id": "1"}
+
+        original = asyncio.ensure_future(table.run(KEY, "a", compute))
+        await started.wait()
+        with pytest.raises(IdempotencyError) as error:
+            await other.run(KEY, "a", compute)
+        assert error.value.status_code == 409
+        release.set()
+        await original
+        # Once the original is done, the other worker replays it
+        return await other.run(KEY, "a", compute)
+
+    try:
+        assert asyncio.run(main()) == ({"record_id": "1"}, True)
+    finally:
+        other.close()
+
+
+def test_failed_request_can_be_retried(table):
+    async def fail():
+        raise RuntimeError("disk full")
+
+    async def compute():
+        return {"record_id": "2"}
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(table.run(KEY, "a", fail))
+    assert asyncio.run(table.run(KEY, "a", compute)) == ({"record_id": "2"}, False)
+
+
+def test_submit_form_replays(app_client):
+    client = app_client()
+    headers = {"Idempotency-Key": KEY}
+    first = client.post("/api/submit-form", json=SUBMISSION, headers=headers)
+    again = client.post("/api/submit-form", json=SUBMISSION, headers=headers)
+    assert first.status_code == again.status_code == 200
+    assert again.json() == first.json()
+    assert again.headers["idempotent-replayed"] == "true"
+    assert "idempotent-replayed" not in first.headers
+
+    changed = client.post("/api/submit-form", json={**SUBMISSION, "user": {"id": 6}}, headers=headers)
+    assert changed.status_code == 422
+    assert client.post("/api/submit-form", json=SUBMISSION, headers={"Idempotency-Key": "short"}).status_code == 400
+    logs = client.get("/logs?format=json").json()["logs"]
+    assert [record["record_id"] for record in logs] == [first.json()["record_id"]]
@@ -0,0 +1,103 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from improve_cache import ImprovementCache
+from text_rules import RuleEngine
+
+
+class Backend:
+    """Counts computations, each of which waits until released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = asyncio.Event()
+
+    async def improve(self, text: str) -> str:
+        self.calls += 1
+        await self.release.wait()
+        if text == "fail":
+            raise RuntimeError("backend failed")
+        return text.upper()
+
+
+def test_identical_requests_share_one_computation():
+    async def main():
+        cache, backend = ImprovementCache(), Backend()
+        key = cache.make_key("text", "v1")
+        waiting = [asyncio.ensure_future(cache.get_or_compute(key, lambda: backend.improve("text"))) for _ in range(5)]
+        await asyncio.sleep(0)
+        assert cache.stats()["inflight"] == 1
+        backend.release.set()
+        assert await asyncio.gather(*waiting) == ["TEXT"] * 5
+        # Later requests are answered from the cache
+        assert await cache.get_or_compute(key, lambda: backend.improve("text")) == "TEXT"
+        return cache, backend
+
+    cache, backend = asyncio.run(main())
+    assert backend.calls == 1
+    assert cache.stats()["coalesced"] == 4
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["inflight"] == 0
+
+
+def test_failures_reach_every_waiter_and_are_not_cached():
+    async def main():
+        cache, backend = ImprovementCache(), Backend()
+        key = cache.make_key("fail", "v1")
+        waiting = [asyncio.ensure_future(cache.get_or_compute(key, lambda: backend.improve("fail"))) for _ in range(3)]
+        backend.release.set()
+        results = await asyncio.gather(*waiting, return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute(key, lambda: backend.improve("fail"))
+        return backend
+
+    assert asyncio.run(main()).calls == 2
+
+
+def test_cancelled_caller_does_not_cancel_others():
+    async def main():
+        cache, backend = ImprovementCache(), Backend()
+        key = cache.make_key("text", "v1")
+        first = asyncio.ensure_future(cache.get_or_compute(key, lambda: backend.improve("text")))
+        second = asyncio.ensure_future(cache.get_or_compute(key, lambda: backend.improve("text")))
+        await asyncio.sleep(0)
+        first.cancel()
+        backend.release.set()
+        assert await second == "TEXT"
+        assert first.cancelled()
+        return backend
+
+    assert asyncio.run(main()).calls == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ImprovementCache(maxsize=2)
+    cache.store("a", "A")
+    cache.store("b", "B")
+    assert cache.lookup("a") == "A"
+    cache.store("c", "C")
+    assert cache.lookup("b") is None
+    assert cache.lookup("a") == "A"
+    assert cache.lookup("c") == "C"
+
+
+def test_keys_follow_the_rules_version(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"replacements": {"a": "b"}}), encoding="utf-8")
+    engine = RuleEngine(str(path), check_interval=0)
+    engine.current()
+    before = engine.version
+    assert ImprovementCache.make_key(" text ", before) == ImprovementCache.make_key("text", before)
+
+    path.write_text(json.dumps({"replacements": {"a": "c"}}), encoding="utf-8")
+    # A distinct mtime even on filesystems with coarse timestamps
+    os.utime(path, (1, 1))
+    # Reading the version does not load the file; the periodic check does
+    assert engine.version == before
+    engine.current()
+    assert engine.version != before
+    assert ImprovementCache.make_key("text", engine.version) != ImprovementCache.make_key("text", before)
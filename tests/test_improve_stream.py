@@ -0,0 +1,59 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from text_rules import DEFAULT_RULES, RuleSet
+
+TEXT = "концерт в парке. будет интересно и красиво"
+
+
+def read_events(body: str) -> List[Tuple[Optional[str], Dict[str, Any]]]:
+    """(event name, data) of each Server-Sent Event in a response body"""
+    events = []
+    for block in body.split("\n\n"):
+        if not block:
+            continue
+        name, data = None, None
+        for line in block.split("\n"):
+            field, _, value = line.partition(": ")
+            if field == "event":
+                name = value
+            elif field == "data":
+                data = json.loads(value)
+        events.append((name, data))
+    return events
+
+
+def expected_text() -> str:
+    # The app has no rules file here, so it uses the built-in rules
+    return RuleSet(DEFAULT_RULES).apply(TEXT)
+
+
+def test_deltas_then_done(app_client):
+    client = app_client()
+    response = client.post("/api/improve-text/stream", json={"text": TEXT})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    assert response.headers["cache-control"] == "no-cache"
+    events = read_events(response.text)
+    assert events[-1] == ("done", {})
+    assert all(name is None for name, _ in events[:-1])
+    assert "".join(data["delta"] for _, data in events[:-1]) == expected_text()
+
+
+def test_repeated_text_is_served_from_the_cache(app_client):
+    client = app_client()
+    first = read_events(client.post("/api/improve-text/stream", json={"text": TEXT}).text)
+    second = read_events(client.post("/api/improve-text/stream", json={"text": TEXT}).text)
+    assert second == [(None, {"delta": "".join(data["delta"] for _, data in first[:-1])}), ("done", {})]
+    assert client.get("/api/status").json()["improve_cache"]["hits"] == 1
+
+
+def test_backend_failure_replaces_with_the_fallback(app_client):
+    # Nothing listens on the discard port, so every model call fails
+    client = app_client(llm_backend="http", llm_url="http://127.0.0.1:9", llm_timeout=2.0)
+    events = read_events(client.post("/api/improve-text/stream", json={"text": TEXT}).text)
+    assert events == [("replace", {"text": expected_text()}), ("done", {})]
+
+
+def test_empty_text_is_rejected(app_client):
+    assert app_client().post("/api/improve-text/stream", json={"text": ""}).status_code == 400
@@ -0,0 +1,103 @@
+import asyncio
+
+import httpx
+import pytest
+
+import llm_backend
+from llm_backend import BackendError, CircuitBreaker, HTTPModelBackend
+
+
+class Clock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_backend.time, "monotonic", clock)
+    return clock
+
+
+def test_breaker_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=30)
+    breaker.failure()
+    breaker.failure()
+    breaker.success()
+    breaker.failure()
+    breaker.failure()
+    assert breaker.state == "closed"
+    assert breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+    assert not breaker.allow()
+
+
+def test_half_open_breaker_lets_one_trial_through(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.failure()
+    clock.now += 29
+    assert not breaker.allow()
+    clock.now += 1
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed trial opens the breaker for another period
+    breaker.failure()
+    assert breaker.state == "open"
+    clock.now += 30
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert breaker.allow() and breaker.allow()
+
+
+def test_trial_that_never_reports_back_is_given_up(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30)
+    breaker.failure()
+    clock.now += 30
+    assert breaker.allow()
+    clock.now += 10
+    assert not breaker.allow()
+    clock.now += 20
+    assert breaker.allow()
+
+
+def test_backend_fails_fast_while_the_breaker_is_open(clock):
+    requests = []
+    healthy = False
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        if healthy:
+            return httpx.Response(200, json={"improved_text": "Better"})
+        return httpx.Response(503)
+
+    async def main():
+        nonlocal healthy
+        backend = HTTPModelBackend("http://model", breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30))
+        await backend.start()
+        await backend._client.aclose()
+        backend._client = httpx.AsyncClient(base_url="http://model", transport=httpx.MockTransport(handler))
+        try:
+            for _ in range(4):
+                with pytest.raises(BackendError):
+                    await backend.improve("text")
+            # Two calls reached the model; the breaker refused the others
+            assert len(requests) == 2
+            assert backend.stats()["rejected"] == 2
+            assert backend.stats()["breaker"] == "open"
+
+            healthy = True
+            clock.now += 30
+            assert await backend.improve("text") == "Better"
+            assert backend.stats()["breaker"] == "closed"
+            assert len(requests) == 3
+        finally:
+            await backend.close()
+
+    asyncio.run(main())
@@ -0,0 +1,205 @@
+import asyncio
+import itertools
+import json
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from record_ids import RecordIdGenerator
+from schemas import FormSubmission
+from settings import Settings
+from sharded_log import OFFSETS_FILE, ShardedLog
+from storage import JsonFileStorage, in_time_range
+from submission_index import record_user
+
+WORKERS = 3
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def submission(storage: JsonFileStorage, rng: random.Random, n: int) -> FormSubmission:
+    submission = FormSubmission.model_validate({
+        "user": {"id": rng.randint(1, 5)},
+        "events": [{"title": f"Event {n}", "source": "test"}],
+        "submission_time": (START + timedelta(hours=rng.randint(0, 24 * 10))).isoformat(),
+    })
+    submission.record_id = storage.ids.next()
+    return submission
+
+
+def commit(log: ShardedLog, records):
+    log.commit([(json.dumps(record) + "\n").encode("utf-8") for record in records], records)
+
+
+@pytest.fixture
+def logs(tmp_path):
+    """Three workers' shards with interleaved records, split over several segments"""
+    rng = random.Random(25)
+    logs = [ShardedLog(str(tmp_path), worker, max_bytes=2048, max_age=86400) for worker in range(WORKERS)]
+    for log in logs:
+        log.open()
+    ids = [RecordIdGenerator(worker) for worker in range(WORKERS)]
+    # From before record ids existed; sorts first
+    commit(logs[0], [{"legacy": True}])
+    for n in range(150):
+        worker = rng.choice([0, 0, 1, 2])
+        commit(logs[worker], [{"record_id": ids[worker].next(), "n": n, "i": i} for i in range(rng.randint(1, 3))])
+    yield logs
+    for log in logs:
+        log.close()
+
+
+def merged(log: ShardedLog):
+    return [(name, location) for name, location, _ in log.iter_records()]
+
+
+def read_from(log: ShardedLog, position: int, count: int):
+    after = log.seek(position)
+    return [(name, location) for name, location, _ in itertools.islice(log.iter_records(after), count)]
+
+
+def test_seek_matches_full_merge(logs):
+    full = merged(logs[0])
+    assert len(full) == sum(log.own.index.count for log in logs)
+    for position in range(len(full) + 2):
+        assert read_from(logs[0], position, 2) == full[position:position + 2]
+
+
+def test_seek_through_read_only_shards(logs, tmp_path):
+    reader = ShardedLog(str(tmp_path), 9, max_bytes=2048, max_age=86400)
+    full = merged(reader)
+    assert full == merged(logs[0])
+    for position in range(0, len(full) + 1, 7):
+        assert read_from(reader, position, 3) == full[position:position + 3]
+
+
+def test_offsets_rebuilt_from_log(logs, tmp_path):
+    full = merged(logs[0])
+    for log in logs:
+        log.close()
+    os.remove(tmp_path / "shard-001" / OFFSETS_FILE)
+    with open(tmp_path / "shard-002" / OFFSETS_FILE, "r+b") as f:
+        f.truncate(24)
+
+    reopened = [ShardedLog(str(tmp_path), worker, max_bytes=2048, max_age=86400) for worker in range(WORKERS)]
+    for log in reopened:
+        log.open()
+    for log in reopened:
+        index = log.own.index
+        assert [index.location(n) for n in range(index.count)] == [location for location, _ in log.own.log.iter_records()]
+        assert index.location(index.count) is None
+    for position in range(len(full) + 1):
+        assert read_from(reopened[0], position, 1) == full[position:position + 1]
+    for log in reopened:
+        log.close()
+
+
+def test_seek_after_archiving(logs):
+    full = merged(logs[0])
+    for log in logs:
+        assert log.own.log.archive_closed("9999-12-31", grace=-60)
+    assert merged(logs[0]) == full
+    for position in range(0, len(full) + 1, 5):
+        assert read_from(logs[0], position, 2) == full[position:position + 2]
+
+
+@pytest.fixture
+def storages(tmp_path):
+    """Storage of three workers sharing a log directory, with a few days of submissions"""
+    rng = random.Random(4)
+    settings = Settings(log_dir=str(tmp_path), segment_max_bytes=4096)
+    storages = [JsonFileStorage(settings) for _ in range(WORKERS)]
+    for storage in storages:
+        storage.open()
+    for n in range(300):
+        storage = rng.choice(storages)
+        storage.write_batch([submission(storage, rng, n)])
+    yield storages
+    for storage in storages:
+        storage.close()
+
+
+def read_pages(storage: JsonFileStorage, limit: int, **filters):
+    """Every record, a page at a time, following the cursors like /logs clients do"""
+    records, cursor = [], None
+    while True:
+        after = storage.parse_cursor(cursor) if cursor else None
+        page = list(itertools.islice(storage.iter_logs(after=after, **filters), limit))
+        records.extend(record for _, record in page)
+        if len(page) < limit:
+            return records
+        cursor = page[-1][0]
+
+
+def test_workers_have_their_own_shards(storages):
+    assert sorted(storage.worker for storage in storages) == list(range(WORKERS))
+    assert storages[0].log.shard_names() == ["shard-000", "shard-001", "shard-002"]
+
+
+def test_shards_merge_in_record_id_order(storages):
+    for storage in storages:
+        ids = [record["record_id"] for _, record in storage.iter_logs()]
+        assert len(ids) == 300
+        assert ids == sorted(ids)
+
+
+def test_read_only_shards_follow_their_owner(storages):
+    rng = random.Random(5)
+    before = [record["record_id"] for _, record in storages[0].iter_logs()]
+    added = submission(storages[2], rng, 300)
+    storages[2].write_batch([added])
+    assert [record["record_id"] for _, record in storages[0].iter_logs()] == before + [added.record_id]
+
+
+@pytest.mark.parametrize("durability", ["enqueue", "fsync"])
+def test_saved_ids_follow_log_order(tmp_path, durability):
+    rng = random.Random(6)
+    settings = Settings(log_dir=str(tmp_path), write_durability=durability, write_queue_size=8, write_batch_size=4)
+    storage = JsonFileStorage(settings)
+    storage.open()
+
+    async def save_all():
+        await storage.start()
+        saves = []
+        for n in range(50):
+            submission = FormSubmission.model_validate({"events": [{"title": f"Event {n}", "source": "test"}], "user": {"id": rng.randint(1, 5)}})
+            saves.append(asyncio.create_task(storage.save(submission)))
+            # Stagger the saves, so some arrive while others wait for room in the queue
+            await asyncio.sleep(0)
+        saved = await asyncio.gather(*saves)
+        await storage.stop()
+        return saved
+
+    saved = asyncio.run(save_all())
+    logged = [record["record_id"] for _, record in storage.log.own.log.iter_records()]
+    storage.close()
+    assert logged == sorted(logged)
+    assert sorted(result["record_id"] for result in saved) == logged
+    assert all(os.path.exists(result["filename"]) for result in saved)
+
+
+@pytest.mark.parametrize("filters", [
+    {},
+    {"user_id": "3"},
+    {"since": START + timedelta(days=2, hours=12)},
+    {"since": START + timedelta(days=2), "until": START + timedelta(days=5, hours=6)},
+    {"user_id": "2", "until": START + timedelta(days=7)},
+])
+def test_filtered_pages_match_scan(storages, filters):
+    scan = [record for _, record in storages[0].iter_logs()]
+    expected = [
+        record for record in scan
+        if ("user_id" not in filters or record_user(record) == filters["user_id"])
+        and in_time_range(record, filters.get("since"), filters.get("until"))
+    ]
+    assert expected
+    for storage in storages:
+        assert read_pages(storage, 7, **filters) == expected
+
+
+def test_storage_seek_matches_scan(storages):
+    scan = [record["record_id"] for _, record in storages[0].iter_logs()]
+    for position in range(0, len(scan) + 1, 11):
+        after = storages[1].seek(position)
+        assert [record["record_id"] for _, record in itertools.islice(storages[1].iter_logs(after=after), 3)] == scan[position:position + 3]
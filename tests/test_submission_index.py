@@ -0,0 +1,118 @@
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from submission_index import SubmissionIndex, record_day, record_user
+from submission_log import SegmentLog, parse_time
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def log(tmp_path):
+    """A log over several segments, with submission days out of append order"""
+    rng = random.Random(4)
+    log = SegmentLog(str(tmp_path / "log"), max_bytes=4096)
+    log.append_many([
+        {
+            "n": n,
+            "user": {"id": rng.randint(1, 5)},
+            "submission_time": (START + timedelta(hours=rng.randint(0, 24 * 10))).isoformat(),
+        }
+        for n in range(400)
+    ])
+    log.sync()
+    yield log
+    log.close()
+
+
+@pytest.fixture
+def index(log, tmp_path):
+    index = SubmissionIndex(log, str(tmp_path / "index.ndjson"))
+    index.load()
+    yield index
+    index.close()
+
+
+def read_pages(log, lookup, keep, limit=7):
+    """Records found through ``lookup(after)``, a page at a time, like /logs"""
+    records, after = [], None
+    while True:
+        page = []
+        for location, record in log.read_at(lookup(after)):
+            if keep(record):
+                page.append((location, record))
+                if len(page) == limit:
+                    break
+        records.extend(record for _, record in page)
+        if len(page) < limit:
+            return records
+        after = page[-1][0]
+
+
+def in_range(record, since, until):
+    submitted = parse_time(record["submission_time"])
+    return (since is None or submitted >= since) and (until is None or submitted < until)
+
+
+def test_user_pages_match_scan(log, index):
+    scan = [record for _, record in log.iter_records()]
+    expected = [record for record in scan if record_user(record) == "3"]
+    assert expected
+    assert read_pages(log, lambda after: index.lookup_user("3", after=after), lambda r: record_user(r) == "3") == expected
+
+
+@pytest.mark.parametrize("since, until", [
+    (START + timedelta(days=3, hours=12), None),
+    (None, START + timedelta(days=2, hours=6)),
+    (START + timedelta(days=3), START + timedelta(days=6, hours=6)),
+])
+def test_day_pages_match_scan(log, index, since, until):
+    scan = [record for _, record in log.iter_records()]
+    expected = [record for record in scan if in_range(record, since, until)]
+    assert expected
+    pages = read_pages(
+        log,
+        lambda after: index.lookup_days(since, until, after=after),
+        lambda record: in_range(record, since, until),
+    )
+    assert pages == expected
+
+
+def test_lookup_days_covers_whole_days_in_order(log, index):
+    since, until = START + timedelta(days=2, hours=20), START + timedelta(days=4, hours=1)
+    locations = list(index.lookup_days(since, until))
+    assert locations == sorted(locations)
+    days = {record_day(record) for _, record in log.read_at(locations)}
+    assert days == {"2026-01-03", "2026-01-04", "2026-01-05"}
+    assert len(locations) == sum(1 for _, record in log.iter_records() if record_day(record) in days)
+
+
+def test_sidecar_reload_matches_rebuild(log, index, tmp_path):
+    index.close()
+    reloaded = SubmissionIndex(log, str(tmp_path / "index.ndjson"))
+    reloaded.load()
+    os.remove(tmp_path / "index.ndjson")
+    rebuilt = SubmissionIndex(log, str(tmp_path / "index.ndjson"))
+    rebuilt.load()
+
+    for other in (reloaded, rebuilt):
+        assert other.count == index.count == 400
+        assert other.last == index.last
+        assert other.lookup_user("2") == index.lookup_user("2")
+        assert list(other.lookup_days()) == list(index.lookup_days())
+    reloaded.close()
+    rebuilt.close()
+
+
+def test_sidecar_caught_up_with_log(log, index, tmp_path):
+    index.close()
+    log.append({"n": 400, "user": {"id": 9}, "submission_time": START.isoformat()})
+    log.sync()
+    caught_up = SubmissionIndex(log, str(tmp_path / "index.ndjson"))
+    caught_up.load()
+    assert caught_up.count == 401
+    assert [record["n"] for _, record in log.read_at(caught_up.lookup_user("9"))] == [400]
+    caught_up.close()
@@ -0,0 +1,103 @@
+import random
+import re
+
+import pytest
+
+from text_rules import DEFAULT_RULES, RuleSet, trie_pattern
+
+
+def legacy_improve(text: str) -> str:
+    """improve_text_with_llm as it was before the rule engine, kept as the reference"""
+    improved = text.strip()
+    improved = '. '.join(s.capitalize() for s in improved.split('. '))
+    if improved:
+        improved = improved[0].upper() + improved[1:]
+    if len(improved) < 100:
+        improved += " Это захватывающее событие обещает стать незабываемым для всех посетителей."
+    replacements = {
+        "хорошо": "превосходно",
+        "интересно": "захватывающе",
+        "важно": "исключительно важно",
+        "событие": "мероприятие",
+        "красивый": "великолепный",
+        "большой": "масштабный"
+    }
+    for word, replacement in replacements.items():
+        improved = improved.replace(word, replacement)
+    if len(improved) > 200:
+        sentences = improved.split('. ')
+        if len(sentences) > 3:
+            paragraphs = []
+            current_paragraph = []
+            for i, sentence in enumerate(sentences):
+                current_paragraph.append(sentence)
+                if (i + 1) % 3 == 0 or i == len(sentences) - 1:
+                    paragraphs.append('. '.join(current_paragraph) + '.')
+                    current_paragraph = []
+            improved = '\n\n'.join(paragraphs)
+    return improved
+
+
+WORDS = ["концерт", "в", "парке", "будет", "хорошо", "очень", "интересно", "и", "важно", "событие", "красивый", "большой", "зал", "вход", "свободный"]
+
+
+def random_text(rng: random.Random) -> str:
+    # Sentences start with a word that is not a rule word and have no capitals
+    # inside, where the old code's str.capitalize() differs by design
+    sentences = [
+        " ".join([rng.choice(WORDS[:4])] + [rng.choice(WORDS) for _ in range(rng.randint(1, 8))])
+        for _ in range(rng.randint(1, 12))
+    ]
+    return ". ".join(sentences) + "."
+
+
+def test_matches_old_function():
+    rules = RuleSet(DEFAULT_RULES)
+    rng = random.Random(7)
+    grouped = 0
+    for _ in range(500):
+        text = random_text(rng)
+        expected = legacy_improve(text)
+        if "\n\n" in expected:
+            # The old grouping added a period after the last one
+            assert expected.endswith("..")
+            expected = expected[:-1]
+            grouped += 1
+        assert rules.apply(text) == expected
+    assert grouped > 50
+
+
+def test_sentences_end_at_any_mark():
+    rules = RuleSet({"replacements": {"хорошо": "превосходно"}})
+    assert rules.apply("всё хорошо! правда? да.  конечно") == "Всё превосходно! Правда? Да.  Конечно"
+
+
+def test_keeps_case_inside_sentences():
+    rules = RuleSet({})
+    assert rules.apply("встреча в Москве. потом в Казани") == "Встреча в Москве. Потом в Казани"
+
+
+def test_paragraphs_every_few_sentences():
+    rules = RuleSet({"paragraph_min_length": 10, "sentences_per_paragraph": 2})
+    assert rules.apply("раз. два. три. четыре. пять.") == "Раз. Два.\n\nТри. Четыре.\n\nПять."
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("большой", "огромный"),
+    ("большойзал", "огромныйзал"),
+    # Like str.replace, rule words match inside other words
+    ("большо", "малыйьшо"),
+    ("бол", "малый"),
+])
+def test_longest_rule_word_wins(text, expected):
+    rules = RuleSet({"replacements": {"бол": "малый", "большой": "огромный"}})
+    assert rules.apply(text) == expected[:1].upper() + expected[1:]
+
+
+def test_trie_pattern_matches_only_the_words():
+    words = ["кот", "кошка", "кошки", "пёс", "a.b"]
+    pattern = re.compile(trie_pattern(words))
+    for word in words:
+        assert pattern.fullmatch(word)
+    for other in ["ко", "кош", "кошк", "пе", "axb"]:
+        assert not pattern.fullmatch(other)
@@ -0,0 +1,106 @@
+import asyncio
+import hashlib
+import os
+from typing import List, Tuple
+
+import pytest
+
+from blob_store import BlobStore
+from uploads import StreamingUpload, UploadError
+
+BOUNDARY = "test-boundary"
+CONTENT_TYPE = f"multipart/form-data; boundary={BOUNDARY}"
+PNG = b"\x89PNG\r\n\x1a\n" + b"\0" * 200
+
+
+def multipart(parts: List[Tuple[str, str, bytes]]) -> bytes:
+    """Body with (field, filename, content) parts; an empty filename makes a plain field"""
+    body = b""
+    for field, filename, content in parts:
+        disposition = f'form-data; name="{field}"' + (f'; filename="{filename}"' if filename else "")
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + content + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = BlobStore(str(tmp_path))
+    store.open()
+    yield store
+    store.close()
+
+
+def receive(store: BlobStore, body: bytes, chunk_size: int = 7, max_file_size: int = 1024, max_files: int = 2):
+    upload = StreamingUpload(store, max_file_size, max_files)
+
+    async def chunks():
+        for start in range(0, len(body), chunk_size):
+            yield body[start:start + chunk_size]
+
+    asyncio.run(upload.receive(CONTENT_TYPE, chunks()))
+    return upload
+
+
+def leftovers(store: BlobStore) -> List[str]:
+    return os.listdir(store.tmp_dir)
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 4096])
+def test_files_are_stored_under_their_hash(store, chunk_size):
+    text = "описание события".encode("utf-8")
+    upload = receive(store, multipart([
+        ("section", "", b"1"),
+        ("images1", "photo.png", PNG),
+        ("textFiles1", "notes.txt", text),
+    ]), chunk_size)
+    files = upload.result()
+    assert [(file["field"], file["filename"], file["size"], file["image_format"]) for file in files] == [
+        ("images1", "photo.png", len(PNG), "png"),
+        ("textFiles1", "notes.txt", len(text), None),
+    ]
+    for file, content in zip(files, [PNG, text]):
+        assert file["sha256"] == hashlib.sha256(content).hexdigest()
+        with open(store.blob_path(file["sha256"]), "rb") as f:
+            assert f.read() == content
+    assert upload.fields == {"section": "1"}
+    assert leftovers(store) == []
+
+
+def test_empty_file_input_is_ignored(store):
+    assert receive(store, multipart([("images1", "", b"")])).result() == []
+
+
+@pytest.mark.parametrize("parts, status", [
+    # Too large, after some data was already written to disk
+    ([("textFiles1", "big.txt", b"x" * 1025)], 413),
+    ([("images1", f"{n}.png", PNG) for n in range(3)], 413),
+    ([("images1", "fake.png", b"GIF87 is not what it says")], 415),
+    ([("avatar", "photo.png", PNG)], 400),
+    ([("comment", "", b"x" * 2000)], 413),
+])
+def test_limits_abort_the_upload_and_remove_partial_files(store, parts, status):
+    with pytest.raises(UploadError) as error:
+        receive(store, multipart(parts))
+    assert error.value.status_code == status
+    assert leftovers(store) == []
+
+
+def test_only_multipart_bodies_are_accepted(store):
+    upload = StreamingUpload(store, 1024, 2)
+
+    async def body():
+        yield b"{}"
+
+    with pytest.raises(UploadError) as error:
+        asyncio.run(upload.receive("application/json", body()))
+    assert error.value.status_code == 400
+
+
+def test_upload_endpoint(app_client):
+    client = app_client(upload_max_file_size=1024)
+    response = client.post("/api/upload", files={"images1": ("photo.png", PNG, "image/png")})
+    assert response.status_code == 200
+    assert response.json()["files"][0]["sha256"] == hashlib.sha256(PNG).hexdigest()
+
+    response = client.post("/api/upload", files={"textFiles1": ("big.txt", b"x" * 2048, "text/plain")})
+    assert response.status_code == 413
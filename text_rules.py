@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+# Used when the rule file does not exist
+DEFAULT_RULES: Dict[str, Any] = {
+    "replacements": {
+        "хорошо": "превосходно",
+        "интересно": "захватывающе",
+        "важно": "исключительно важно",
+        "событие": "мероприятие",
+        "красивый": "великолепный",
+        "большой": "масштабный",
+    },
+    "tagline": "Это захватывающее событие обещает стать незабываемым для всех посетителей.",
+    "tagline_max_length": 100,
+    "paragraph_min_length": 200,
+    "sentences_per_paragraph": 3,
+}
+
+
+def trie_pattern(words: List[str]) -> str:
+    """
+    Regex matching any of ``words``, with shared prefixes factored into a trie.
+
+    At each position the regex engine follows one branch per character instead
+    of trying every word in turn, so matching cost depends on word length, not
+    on how many words there are. Optional groups are greedy, so the longest
+    word wins when one word is a prefix of another.
+    """
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node: Dict[str, Any]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        pattern = "(?:" + "|".join(branches) + ")"
+        return pattern + "?" if "" in node else pattern
+
+    return build(trie)
+
+
+class RuleSet:
+    """A rule table compiled into a single regex, applied in one pass over the text"""
+
+    def __init__(self, rules: Dict[str, Any], version: str = ""):
+        self.version = version
+        self.replacements: Dict[str, str] = {k: v for k, v in rules.get("replacements", {}).items() if k}
+        self.tagline: str = rules.get("tagline", "")
+        self.tagline_max_length: int = rules.get("tagline_max_length", 100)
+        self.paragraph_min_length: int = rules.get("paragraph_min_length", 200)
+        self.sentences_per_paragraph: int = rules.get("sentences_per_paragraph", 3)
+        # A rule word, or the end of a sentence followed by the whitespace before the next one
+        alternatives = [r"(?P<end>[.!?])(?P<gap>\s+)"]
+        if self.replacements:
+            alternatives.insert(0, trie_pattern(list(self.replacements)))
+        self.pattern = re.compile("|".join(alternatives))
+
+    def apply(self, text: str) -> str:
+        text = text.strip()
+        if not text:
+            return ""
+
+        # Add some enhancements
+        if self.tagline and len(text) < self.tagline_max_length:
+            text += " " + self.tagline
+
+        pieces: List[str] = []
+        gaps: List[int] = []  # indexes of the whitespace between sentences in pieces
+        capitalize = True
+
+        def emit(piece: str):
+            nonlocal capitalize
+            if capitalize and piece:
+                # The first letter of each sentence is capitalized
+                piece = piece[:1].upper() + piece[1:]
+                capitalize = False
+            pieces.append(piece)
+
+        position = 0
+        for match in self.pattern.finditer(text):
+            emit(text[position:match.start()])
+            if match.group("end") is None:
+                emit(self.replacements[match.group()])
+            else:
+                emit(match.group("end"))
+                gaps.append(len(pieces))
+                pieces.append(match.group("gap"))
+                capitalize = True
+            position = match.end()
+        emit(text[position:])
+
+        # Group sentences into paragraphs if the text is long enough
+        length = sum(len(piece) for piece in pieces)
+        every = self.sentences_per_paragraph
+        if length > self.paragraph_min_length and every > 0 and len(gaps) + 1 > every:
+            for i, index in enumerate(gaps):
+                if (i + 1) % every == 0:
+                    pieces[index] = "\n\n"
+
+        return "".join(pieces)
+
+
+class RuleEngine:
+    """
+    Rule set loaded from a JSON file and reloaded when the file changes.
+
+    The file is first read on first use. Its modification time is then checked
+    at most every ``check_interval`` seconds. If a changed file cannot be
+    loaded, the previous rules stay in use.
+
+    ``version`` never touches the file, so it is safe on the event loop;
+    ``current`` and ``improve`` may read and compile it, so they are run in
+    a thread (the app also calls ``current`` there every ``check_interval``).
+    """
+
+    def __init__(self, path: str, check_interval: float = 1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._mtime: Optional[float] = None
+        self._checked = float("-inf")
+        self.rules = RuleSet(DEFAULT_RULES, version=self._digest(DEFAULT_RULES))
+
+    @staticmethod
+    def _digest(rules: Dict[str, Any]) -> str:
+        data = json.dumps(rules, ensure_ascii=False, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(data).hexdigest()[:16]
+
+    def _reload(self):
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                rules = json.load(f)
+            self.rules = RuleSet(rules, version=self._digest(rules))
+        except Exception as e:
+            print(f"Error loading text rules from {self.path}: {str(e)}")
+
+    def current(self) -> RuleSet:
+        now = time.monotonic()
+        if now - self._checked >= self.check_interval:
+            with self._lock:
+                if now - self._checked >= self.check_interval:
+                    self._checked = now
+                    self._reload()
+        return self.rules
+
+    @property
+    def version(self) -> str:
+        """Version of the rules in use, as of the last check"""
+        return self.rules.version
+
+    def improve(self, text: str) -> str:
+        return self.current().apply(text)
@@ -0,0 +1,208 @@
+import asyncio
+import hashlib
+import os
+import re
+import uuid
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import aiofiles
+from multipart.exceptions import MultipartParseError
+from multipart.multipart import MultipartParser, parse_options_header
+
+from blob_store import BlobStore
+from image_jobs import SNIFF_BYTES, sniff_image
+
+# File inputs of the form, one pair per event section
+FILE_FIELD = re.compile(r"^(images|textFiles)\d+$")
+# Plain form fields sent along with the files are small
+MAX_FIELD_SIZE = 1024
+
+
+class UploadError(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class UploadPart:
+    def __init__(self):
+        self.headers: Dict[bytes, bytes] = {}
+        self.field = ""
+        self.filename: Optional[str] = None
+        self.content_type = ""
+        self.path: Optional[str] = None
+        self.size = 0
+        self.hash = hashlib.sha256()
+        self.digest: Optional[str] = None
+        self.head = b""
+        self.image_format: Optional[str] = None
+        self.value = bytearray()
+
+
+class StreamingUpload:
+    """
+    Multipart body parser that streams file parts straight to disk.
+
+    The body is fed chunk by chunk; each file part is written to a temporary
+    file as its data arrives, so no file is ever held in memory, and hashed on
+    the way. A finished file is moved into the blob store under its SHA-256.
+    The per-file size limit and the per-field file count are checked while
+    parsing, and the upload is aborted (and its partial files removed) as soon
+    as one is exceeded. Files of image fields must start like an image we
+    accept; only their header is looked at, decoding happens later.
+    """
+
+    def __init__(self, store: BlobStore, max_file_size: int, max_files_per_field: int):
+        self.store = store
+        self.max_file_size = max_file_size
+        self.max_files_per_field = max_files_per_field
+        self.files: List[UploadPart] = []
+        self.fields: Dict[str, str] = {}
+        self._part: Optional[UploadPart] = None
+        self._header_field = b""
+        self._header_value = b""
+        self._counts: Dict[str, int] = {}
+        # File operations collected by the (synchronous) parser callbacks and
+        # carried out asynchronously after each chunk
+        self._pending: List[tuple] = []
+        self._handles: Dict[int, Any] = {}
+
+    def _callbacks(self) -> Dict[str, Any]:
+        return {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        }
+
+    def _on_part_begin(self):
+        self._part = UploadPart()
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._part.headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        part = self._part
+        _, options = parse_options_header(part.headers.get(b"content-disposition", b""))
+        part.field = options.get(b"name", b"").decode("utf-8", "replace")
+        part.content_type = part.headers.get(b"content-type", b"").decode("latin-1")
+        if b"filename" not in options:
+            return
+        filename = os.path.basename(options[b"filename"].decode("utf-8", "replace"))
+        if not filename:
+            # An empty file input is sent as a part without a file name
+            part.field = ""
+            return
+        if not FILE_FIELD.match(part.field):
+            raise UploadError(400, f"Unexpected file field {part.field!r}")
+        self._counts[part.field] = self._counts.get(part.field, 0) + 1
+        if self._counts[part.field] > self.max_files_per_field:
+            raise UploadError(413, f"At most {self.max_files_per_field} files per field")
+        part.filename = filename
+        part.path = self.store.temp_path(uuid.uuid4().hex)
+        self.files.append(part)
+        self._pending.append(("open", part, None))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        part = self._part
+        if part.filename is None:
+            part.value += data[start:end]
+            if len(part.value) > MAX_FIELD_SIZE:
+                raise UploadError(413, f"Field {part.field!r} is too large")
+            return
+        part.size += end - start
+        if part.size > self.max_file_size:
+            raise UploadError(413, f"{part.filename} is larger than {self.max_file_size // (1024 * 1024)}MB")
+        chunk = data[start:end]
+        if len(part.head) < SNIFF_BYTES:
+            part.head += chunk[:SNIFF_BYTES - len(part.head)]
+            if len(part.head) == SNIFF_BYTES:
+                self._check_image(part)
+        part.hash.update(chunk)
+        self._pending.append(("write", part, chunk))
+
+    def _on_part_end(self):
+        part = self._part
+        if part.filename is None:
+            if part.field:
+                self.fields[part.field] = part.value.decode("utf-8", "replace")
+        else:
+            if len(part.head) < SNIFF_BYTES:
+                self._check_image(part)
+            self._pending.append(("close", part, None))
+        self._part = None
+
+    def _check_image(self, part: UploadPart):
+        if not part.field.startswith("images"):
+            return
+        part.image_format = sniff_image(part.head)
+        if part.image_format is None:
+            raise UploadError(415, f"{part.filename} is not a JPEG, PNG, GIF, WebP or BMP image")
+
+    async def _flush_pending(self):
+        for action, part, data in self._pending:
+            if action == "open":
+                self._handles[id(part)] = await aiofiles.open(part.path, "wb")
+            elif action == "write":
+                await self._handles[id(part)].write(data)
+            else:
+                await self._handles.pop(id(part)).close()
+                digest = part.hash.hexdigest()
+                await asyncio.to_thread(self.store.commit, part.path, digest, part.size)
+                part.digest = digest
+        self._pending.clear()
+
+    async def _discard(self):
+        for handle in self._handles.values():
+            await handle.close()
+        self._handles.clear()
+        # Files already moved into the store stay there unreferenced until collected
+        for part in self.files:
+            if part.digest is None:
+                try:
+                    os.remove(part.path)
+                except FileNotFoundError:
+                    pass
+
+    async def receive(self, content_type: str, body: AsyncIterator[bytes]):
+        media_type, options = parse_options_header(content_type)
+        if media_type != b"multipart/form-data" or b"boundary" not in options:
+            raise UploadError(400, "Expected a multipart/form-data body")
+        parser = MultipartParser(options[b"boundary"], self._callbacks())
+        try:
+            async for chunk in body:
+                parser.write(chunk)
+                await self._flush_pending()
+            parser.finalize()
+            await self._flush_pending()
+        except MultipartParseError as e:
+            await self._discard()
+            raise UploadError(400, f"Malformed multipart body: {str(e)}")
+        except BaseException:
+            await self._discard()
+            raise
+
+    def result(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "field": part.field,
+                "filename": part.filename,
+                "content_type": part.content_type,
+                "size": part.size,
+                "sha256": part.digest,
+                "image_format": part.image_format,
+            }
+            for part in self.files
+        ]
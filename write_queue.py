@@ -0,0 +1,107 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional
+
+DURABILITY_MODES = ("enqueue", "fsync")
+
+
+class WriteBehindQueue:
+    """
+    Bounded asyncio queue drained by a background writer task.
+
+    The writer takes everything that is pending (up to ``max_batch`` items)
+    and hands it to ``flush`` in a worker thread, so a whole batch costs one
+    write and one fsync and the event loop never blocks on disk I/O.
+
+    ``prepare`` is called on each item as the writer takes it off the queue,
+    in the order the items are flushed, and ``put`` returns its result. With
+    ``durability="enqueue"`` ``put`` returns as soon as the writer has taken
+    the item; with ``durability="fsync"`` it waits until the batch containing
+    the item has been flushed and re-raises any error from ``flush``. When the
+    queue is full ``put`` waits, which pushes back on the callers.
+    """
+
+    def __init__(
+        self,
+        flush: Callable[[List[Any]], None],
+        maxsize: int = 1000,
+        max_batch: int = 256,
+        durability: str = "fsync",
+        prepare: Optional[Callable[[Any], Any]] = None,
+    ):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability}")
+        self.flush = flush
+        self.maxsize = maxsize
+        self.max_batch = max_batch
+        self.durability = durability
+        self.prepare = prepare
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush everything still queued, then stop the writer"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def put(self, item: Any) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((item, future))
+        return await future
+
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth(),
+            "maxsize": self.maxsize,
+            "durability": self.durability,
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+        }
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            prepared = [self.prepare(item) if self.prepare else None for item, _ in batch]
+            if self.durability == "enqueue":
+                for (_, future), result in zip(batch, prepared):
+                    if not future.done():
+                        future.set_result(result)
+            try:
+                await asyncio.to_thread(self.flush, [item for item, _ in batch])
+            except Exception as e:
+                print(f"Error flushing write queue: {str(e)}")
+                self.failed += len(batch)
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            else:
+                self.batches += 1
+                self.written += len(batch)
+                for (_, future), result in zip(batch, prepared):
+                    if not future.done():
+                        future.set_result(result)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()